@@ -2,7 +2,7 @@ import argparse
 import ConfigParser as configparser
 import sys
 from collections import OrderedDict
-from tofu.util import positive_int, tupleize
+from tofu.util import positive_float, positive_int, strictly_positive_int, tupleize
 
 
 NAME = "reco.conf"
@@ -61,7 +61,23 @@ SECTIONS['reading'] = {
     'step': {
         'type': positive_int,
         'default': 1,
-        'help': 'Read every \"step\" file'}}
+        'help': 'Read every \"step\" file'},
+    'bin': {
+        'type': strictly_positive_int,
+        'default': 1,
+        'help': "Bin input images by this factor horizontally and vertically"},
+    'raw-shape': {
+        'default': None,
+        'type': tupleize(2, int),
+        'help': "Width and height of the images in raw input files"},
+    'raw-dtype': {
+        'default': 'float32',
+        'type': str,
+        'help': "Data type of the images in raw input files"},
+    'raw-offset': {
+        'default': 0,
+        'type': positive_int,
+        'help': "Offset in bytes to the first image in raw input files"}}
 SECTIONS['flat-correction'] = {
     'darks': {
         'default': '',
@@ -105,6 +121,11 @@ SECTIONS['reconstruction'] = {
         'type': float,
         'help': "Angle step between projections in radians"}}
 SECTIONS['tomographic-reconstruction'] = {
+    'backend': {
+        'default': 'ufo',
+        'type': str,
+        'help': "Reconstruction backend, numpy runs filtered backprojection on the CPU",
+        'choices': ['ufo', 'numpy']},
     'axis': {
         'default': None,
         'type': float,
@@ -121,7 +142,12 @@ SECTIONS['tomographic-reconstruction'] = {
         'default': 'fbp',
         'type': str,
         'help': "Reconstruction method",
-        'choices': ['fbp', 'sart', 'dfi']}}
+        'choices': ['fbp', 'sart', 'dfi']},
+    'workers': {
+        'default': 1,
+        'type': positive_int,
+        'help': "Number of processes reconstructing slices with the numpy backend, 0 uses "
+                "all CPUs"}}
 SECTIONS['laminographic-reconstruction'] = {
     'axis': {
         'default': None,
@@ -156,6 +182,10 @@ SECTIONS['laminographic-reconstruction'] = {
         'type': float,
         'help': "Axis misalignment angle in radians"}}
 SECTIONS['fbp'] = {
+    'cache-filters': {
+        'default': False,
+        'help': "Store ramp filters of the numpy backend in the cache directory",
+        'action': 'store_true'},
     'crop-width': {
         'default': None,
         'type': positive_int,
@@ -227,7 +257,15 @@ SECTIONS['estimate'] = {
         'type': str,
         'default': 'reconstruction',
         'help': 'Rotation axis estimation algorithm',
-        'choices': ['reconstruction', 'correlation']}}
+        'choices': ['reconstruction', 'coarse-to-fine', 'correlation']},
+    'coarse-bin': {
+        'default': 4,
+        'type': strictly_positive_int,
+        'help': "Binning of the sinogram for the coarse search of the coarse-to-fine method"},
+    'axis-tolerance': {
+        'default': 0.5,
+        'type': positive_float,
+        'help': "Tolerance of the axis position found by the coarse-to-fine method in pixels"}}
 
 
 def get_config_name():
@@ -0,0 +1,641 @@
+"""Filtered backprojection on the CPU with NumPy.
+
+This engine reconstructs like the UFO graph which :func:`tofu.reco.tomo` sets up for --method=fbp
+but needs neither UFO nor OpenCL, it is selected with --backend=numpy. Sinograms are padded like
+:func:`tofu.reco.setup_padding`, ramp filtered with batched real FFTs and backprojected with
+linear interpolation in float32. The backprojection processes the slices in square tiles and
+the projections in groups, such that the temporary arrays stay small enough for the CPU caches,
+and the sample positions of every tile are shared by all slices reconstructed at once.
+"""
+import errno
+import logging
+import os
+import time
+import numpy as np
+from collections import OrderedDict
+from tofu import formats
+from tofu.index import get_cache_dir, image_info
+from tofu.tifffile import imsave
+from tofu.util import (bin_image, determine_shape, get_filenames, get_output_name, get_padding,
+                       probe_image, read_image)
+
+
+LOG = logging.getLogger(__name__)
+
+# Number of slices reconstructed at once
+SLICE_BATCH = 8
+
+# Number of bytes of the projection rows read at once with --from-projections
+BAND_SIZE = 2 ** 28
+
+# Number of sinogram rows transformed by one FFT call
+FFT_BATCH = 1024
+
+# Side length of the slice tiles which are backprojected at once
+TILE_SIZE = 64
+
+# Number of elements of the temporary arrays in one backprojection step
+BLOCK_SIZE = 2 ** 19
+
+# Number of ramp filters kept in memory by get_filter
+FILTER_CACHE_SIZE = 16
+
+# Ramp filters keyed by (width, kind, dtype), the least recently used one first
+_FILTERS = OrderedDict()
+
+
+def ramp_filter(width, kind='ramp-fromreal', dtype=np.float32):
+    """Return the ramp filter for *width* padded pixels as a real array of *width* // 2 + 1
+    frequencies (the layout of np.fft.rfft) of *dtype*. With *kind* 'ramp' the filter is |f|,
+    with 'ramp-fromreal' it is the discrete Fourier transform of the band-limited ramp filter in
+    real space, which does not shift the mean of the reconstruction.
+    """
+    if kind == 'ramp':
+        return np.fft.rfftfreq(width).astype(dtype)
+
+    if kind != 'ramp-fromreal':
+        raise ValueError("Unknown filter '{}'".format(kind))
+
+    distance = np.minimum(np.arange(width), width - np.arange(width))
+    kernel = np.zeros(width)
+    kernel[0] = 0.25
+    odd = distance % 2 == 1
+    kernel[odd] = -1 / (np.pi * distance[odd]) ** 2
+
+    return np.fft.rfft(kernel).real.astype(dtype)
+
+
+def _filter_filename(key):
+    width, kind, dtype = key
+    return os.path.join(get_cache_dir('filters'), '{}-{}-{}.npy'.format(kind, width, dtype))
+
+
+def _load_filter(key):
+    """Load the filter for *key* from disk, return None if it is not stored."""
+    try:
+        spectrum = np.load(_filter_filename(key))
+    except (IOError, OSError, ValueError):
+        return None
+
+    width, kind, dtype = key
+    if spectrum.shape != (width // 2 + 1, ) or spectrum.dtype != np.dtype(dtype):
+        return None
+
+    return spectrum
+
+
+def _save_filter(key, spectrum):
+    """Store *spectrum* for *key* atomically, errors are only logged."""
+    filename = _filter_filename(key)
+    tmp_name = '{}.{}.tmp.npy'.format(filename[:-4], os.getpid())
+    try:
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        np.save(tmp_name, spectrum)
+        os.rename(tmp_name, filename)
+    except (IOError, OSError) as e:
+        LOG.debug("Cannot store filter '{}': {}".format(filename, e))
+
+
+def get_filter(width, kind='ramp-fromreal', dtype=np.float32, use_disk=False):
+    """Return the read-only :func:`ramp_filter` for *width* padded pixels, *kind* and *dtype*.
+    The :data:`FILTER_CACHE_SIZE` most recently used filters are kept in memory. If *use_disk* is
+    True, filters missing in memory are loaded from the cache directory (*TOFU_CACHE_DIR*
+    environment variable or ~/.cache/tofu) and newly computed ones are stored there for later
+    runs.
+    """
+    key = (width, kind, np.dtype(dtype).name)
+    spectrum = _FILTERS.pop(key, None)
+
+    if spectrum is None and use_disk:
+        spectrum = _load_filter(key)
+        if spectrum is None:
+            spectrum = ramp_filter(width, kind=kind, dtype=dtype)
+            _save_filter(key, spectrum)
+    elif spectrum is None:
+        spectrum = ramp_filter(width, kind=kind, dtype=dtype)
+
+    spectrum.flags.writeable = False
+    _FILTERS[key] = spectrum
+    while len(_FILTERS) > FILTER_CACHE_SIZE:
+        _FILTERS.popitem(last=False)
+
+    return spectrum
+
+
+def filter_sinograms(sinograms, kind='ramp-fromreal', use_disk=False):
+    """Return *sinograms* of shape (count, num_projections, width) padded with their edge values
+    to the width of :func:`tofu.util.get_padding`, ramp filtered and cropped back to *width* as
+    float32. The filter is taken from :func:`get_filter`, which stores it on disk if *use_disk* is
+    True.
+    """
+    count, num_projections, width = sinograms.shape
+    padded_width, x = get_padding(width)
+    spectrum = get_filter(padded_width, kind=kind, use_disk=use_disk)
+    rows = sinograms.reshape(-1, width)
+    result = np.empty(rows.shape, dtype=np.float32)
+
+    for first in range(0, len(rows), FFT_BATCH):
+        batch = rows[first:first + FFT_BATCH]
+        padded = np.pad(batch, ((0, 0), (x, padded_width - width - x)), mode='edge')
+        filtered = np.fft.irfft(np.fft.rfft(padded) * spectrum, n=padded_width)
+        result[first:first + FFT_BATCH] = filtered[:, x:x + width]
+
+    return result.reshape(sinograms.shape)
+
+
+def backproject(sinograms, axis, angles, size=None):
+    """Backproject filtered *sinograms* of shape (count, num_projections, width) with rotation
+    axis at *axis* and projection *angles* in radians. Return slices of shape (count, *size*,
+    *size*) centered on the detector, *size* defaults to the sinogram width. Pixels are sampled
+    with linear interpolation and samples outside of the detector are zero. If *axis* is a
+    sequence of positions, every sinogram is backprojected for each of them in the same pass and
+    the result has shape (count, len(axis), size, size).
+    """
+    count, num_projections, width = sinograms.shape
+    size = size or width
+    row_width = width + 3
+    axes = np.array(axis, dtype=np.float32).reshape(-1, 1, 1, 1)
+
+    # Zero columns around the sinogram rows make samples outside of the detector vanish
+    padded = np.zeros((count, num_projections, row_width), dtype=np.float32)
+    padded[..., 1:width + 1] = sinograms
+    padded = padded.reshape(count, -1)
+    slope = np.diff(padded, axis=1)
+    row_offsets = (np.arange(num_projections) * row_width).reshape(-1, 1, 1)
+
+    # The sample position of pixel center (x, y) relative to the axis is axis + x cos + y sin.
+    # With detector coordinates of the pixel centers this becomes x cos + y sin + axis (1 - cos -
+    # sin), i.e. different axes only shift the positions by a constant per projection. In the
+    # padded rows the center of detector pixel i is at i + 1.5.
+    coords = np.arange(size, dtype=np.float32) + np.float32((width - size) // 2 + 0.5)
+    cos = np.cos(angles).astype(np.float32).reshape(-1, 1, 1)
+    sin = np.sin(angles).astype(np.float32).reshape(-1, 1, 1)
+    shifts = axes * (1 - cos - sin) + np.float32(0.5)
+
+    result = np.zeros((count, len(axes), size, size), dtype=np.float32)
+    step = max(1, BLOCK_SIZE // (TILE_SIZE ** 2 * count * len(axes)))
+
+    for y in range(0, size, TILE_SIZE):
+        by = coords[y:y + TILE_SIZE].reshape(-1, 1)
+        for x in range(0, size, TILE_SIZE):
+            bx = coords[x:x + TILE_SIZE]
+            tile = result[..., y:y + TILE_SIZE, x:x + TILE_SIZE]
+            for first in range(0, num_projections, step):
+                last = first + step
+                position = shifts[:, first:last] + (bx * cos[first:last] + by * sin[first:last])
+                np.clip(position, 0, width + 1, out=position)
+                left = np.floor(position)
+                # Interpolate with the slope between the left and the right sample
+                position -= left
+                index = left.astype(np.intp)
+                index += row_offsets[first:last]
+                tile += np.take(padded, index, axis=1).sum(axis=2)
+                tile += np.einsum('kbaij,baij->kbij', np.take(slope, index, axis=1), position)
+
+    result *= np.float32(np.pi / num_projections)
+
+    return result if np.ndim(axis) else result[:, 0]
+
+
+def _select(filenames, params):
+    """Return the *filenames* selected by the start, number and step of *params*."""
+    stop = params.start + params.number if params.number else None
+
+    return filenames[params.start:stop:params.step]
+
+
+def _get_max_open_files():
+    """Return how many files may be kept open within the current soft limit of open files,
+    leaving some for the rest of the process.
+    """
+    try:
+        import resource
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError, OSError):
+        return 256
+
+    return 65536 if soft == resource.RLIM_INFINITY else max(0, soft - 64)
+
+
+def _get_band_height(num_files, width):
+    """Return the number of rows of *num_files* images of *width* pixels which are read at once,
+    a multiple of :data:`SLICE_BATCH` such that a band takes about :data:`BAND_SIZE` bytes.
+    """
+    height = BAND_SIZE // (4 * num_files * width) // SLICE_BATCH * SLICE_BATCH
+
+    return max(SLICE_BATCH, height)
+
+
+class RowReader(object):
+
+    """Read bands of rows of the images *filenames* with the row step, binning and raw file layout
+    of *params*.
+    Uncompressed single images are memory mapped on first access and the maps are kept open
+    between reads if the number of files does not exceed the limit of open files, all other
+    images are read with :func:`tofu.util.read_image`.
+    """
+
+    def __init__(self, filenames, params):
+        self.filenames = filenames
+        self.step = params.y_step
+        self.bin = params.bin
+        self.raw_options = formats.get_raw_options(params)
+        self._maps = {} if len(filenames) <= _get_max_open_files() else None
+
+    def _get_map(self, filename):
+        if self._maps is None:
+            return None
+
+        if filename not in self._maps:
+            image = None
+            if not formats.is_stack(formats.split_reference(filename)[0]):
+                width, height, dtype, num_pages, offset = image_info(filename)
+                if offset is not None and num_pages == 1:
+                    image = np.memmap(filename, dtype=dtype, mode='r', offset=offset,
+                                      shape=(height, width))
+            self._maps[filename] = image
+
+        return self._maps[filename]
+
+    def read(self, y, count):
+        """Read *count* (binned) rows starting at row *y* of all files. Return a float32 array of
+        shape (len(filenames), count, width).
+        """
+        height = count * self.bin * self.step
+        result = None
+
+        for i, filename in enumerate(self.filenames):
+            image = self._get_map(filename)
+            if image is None:
+                rows = read_image(filename, y=y, height=height, y_step=self.step,
+                                  dtype=np.float32, binning=self.bin, **self.raw_options)
+            elif self.bin > 1:
+                rows = bin_image(image[y:y + height:self.step], self.bin, dtype=np.float32)
+            else:
+                rows = image[y:y + height:self.step]
+            if result is None:
+                result = np.empty((len(self.filenames), ) + rows.shape, dtype=np.float32)
+            result[i] = rows
+
+        return result
+
+    def close(self):
+        if self._maps:
+            self._maps.clear()
+
+
+def _reduce(images, mode):
+    if mode == 'median':
+        return np.median(images, axis=0)
+    if mode == 'average':
+        return np.mean(images, axis=0)
+
+    raise ValueError('Invalid reduction mode')
+
+
+def _read_reduced(path, num_rows, width, params):
+    """Read *num_rows* (binned) rows of *width* pixels of all images in *path* in bands and
+    return them reduced to one image by the reduction mode of *params*.
+    """
+    filenames = get_filenames(path, **formats.get_raw_options(params))
+    reader = RowReader(filenames, params)
+    band = _get_band_height(len(filenames), width)
+    result = np.empty((num_rows, width), dtype=np.float32)
+
+    try:
+        for first in range(0, num_rows, band):
+            count = min(band, num_rows - first)
+            y = params.y + first * params.bin * params.y_step
+            result[first:first + count] = _reduce(reader.read(y, count),
+                                                  params.reduction_mode.lower())
+    finally:
+        reader.close()
+
+    return result
+
+
+def _read_flat_fields(num_rows, width, params):
+    """Return a tuple (dark, flat, flat2) of the reduced darks and flats of all *num_rows* rows
+    with the dark already subtracted from the flats, *flat2* is None without --flats2.
+    """
+    dark = _read_reduced(params.darks, num_rows, width, params)
+    dark *= params.dark_scale
+    flat = _read_reduced(params.flats, num_rows, width, params) - dark
+    flat2 = None
+
+    if params.flats2:
+        flat2 = _read_reduced(params.flats2, num_rows, width, params) - dark
+
+    return (dark, flat, flat2)
+
+
+def _flat_correct(projections, dark, flat, flat2, params):
+    """Flat field correct *projections* of shape (num_projections, count, width) with *dark* and
+    *flat* of shape (count, width), *flat2* is interpolated with *flat* over the projections if
+    it is not None.
+    """
+    if flat2 is not None:
+        weights = np.linspace(0, 1, len(projections)).astype(np.float32).reshape(-1, 1, 1)
+        flat = flat + weights * (flat2 - flat)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        projections -= dark
+        projections /= flat
+        if params.absorptivity:
+            projections = -np.log(projections)
+
+    if params.fix_nan_and_inf:
+        projections[~np.isfinite(projections)] = 0
+
+    return projections
+
+
+def read_sinograms(params):
+    """Yield the sinograms specified by *params* in batches of at most :data:`SLICE_BATCH` as
+    float32 arrays of shape (count, num_projections, width). Sinograms are either read from
+    sinogram files or, with --from-projections, transposed from the rows of projections which
+    are flat field corrected if darks and flats are given. Projections are read in bands of
+    about :data:`BAND_SIZE` bytes by a :class:`RowReader`, darks and flats are read and reduced
+    only once for all rows.
+    """
+    raw_options = formats.get_raw_options(params)
+    filenames = _select(get_filenames(params.input, **raw_options), params)
+    if not filenames:
+        raise ValueError("No input found in '{}'".format(params.input))
+
+    if not params.from_projections:
+        batch = []
+        for filename in filenames:
+            sinogram = read_image(filename, y=params.y, height=params.height,
+                                  y_step=params.y_step, dtype=np.float32, binning=params.bin,
+                                  **raw_options)
+            batch.extend(sinogram.reshape((-1, ) + sinogram.shape[-2:]))
+            if len(batch) >= SLICE_BATCH:
+                yield np.array(batch[:SLICE_BATCH])
+                batch = batch[SLICE_BATCH:]
+        if batch:
+            yield np.array(batch)
+        return
+
+    height = params.height or determine_shape(params)[1] - params.y
+    num_rows = len(range(params.y, params.y + height, params.y_step)) // params.bin
+    width = probe_image(filenames[0], **raw_options)[0] // params.bin
+    band = _get_band_height(len(filenames), width)
+    flat_fields = None
+
+    if params.darks and params.flats:
+        flat_fields = _read_flat_fields(num_rows, width, params)
+
+    reader = RowReader(filenames, params)
+    try:
+        for first in range(0, num_rows, band):
+            count = min(band, num_rows - first)
+            projections = reader.read(params.y + first * params.bin * params.y_step, count)
+            if flat_fields:
+                rows = [None if field is None else field[first:first + count]
+                        for field in flat_fields]
+                projections = _flat_correct(projections, *(rows + [params]))
+            for i in range(0, count, SLICE_BATCH):
+                yield np.ascontiguousarray(projections[:, i:i + SLICE_BATCH].transpose(1, 0, 2))
+    finally:
+        reader.close()
+
+
+def reconstruct_axes(sinogram, axes, params):
+    """Return the slices reconstructed from one filtered *sinogram* of shape (num_projections,
+    width) for each of the axis positions *axes* in unbinned pixels, with the remaining geometry
+    of *params*. All slices are computed in one backprojection pass.
+    """
+    num_projections, width = sinogram.shape
+    angles, size = get_geometry(params, width, num_projections)[1:]
+    axes = np.asarray(axes, dtype=float) / params.bin
+
+    return backproject(sinogram[np.newaxis], axes, angles, size=size)[0]
+
+
+class SliceWriter(object):
+
+    """Write slices one after another to the files or the stack given by the output name of
+    *params*, see :func:`tofu.util.get_output_name`. Nothing is written with --dry-run.
+    """
+
+    def __init__(self, params):
+        self.index = 0
+        self.filename = None if params.dry_run else get_output_name(params.output)
+        self._stack = None
+
+        if self.filename:
+            hdf5_path = formats.split_hdf5_path(self.filename)
+            directory = os.path.dirname(hdf5_path[0] if hdf5_path else self.filename)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._stack = formats.open_writer(self.filename)
+
+    def write(self, image):
+        if self._stack:
+            self._stack.write(image)
+        elif self.filename:
+            imsave(self.filename % self.index, image)
+        self.index += 1
+
+    def close(self):
+        if self._stack:
+            self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_geometry(params, width, num_projections):
+    """Return a tuple (axis, angles, size) for backprojecting sinograms of *width* (binned)
+    pixels and *num_projections* rows with the axis, angle, offset, crop width and binning of
+    *params*, defaults are the detector center and an angle step of pi / *num_projections*.
+    """
+    axis = params.axis / params.bin if params.axis else width / 2.0
+
+    if params.angle:
+        # Binned sinograms have fewer projections
+        angle_factor = params.bin if not params.from_projections else 1
+        step = params.angle * angle_factor
+    else:
+        step = np.pi / num_projections
+
+    angles = params.offset + step * np.arange(num_projections)
+    size = min(int(params.crop_width) // params.bin, width) if params.crop_width else width
+
+    return (axis, angles, size)
+
+
+def reconstruct(sinograms, params):
+    """Return the slices reconstructed from *sinograms* of shape (count, num_projections, width)
+    with the geometry of *params*, see :func:`get_geometry`.
+    """
+    count, num_projections, width = sinograms.shape
+    axis, angles, size = get_geometry(params, width, num_projections)
+    LOG.debug("Reconstruct {} slices from {}x{} sinograms".format(count, width, num_projections))
+
+    filtered = filter_sinograms(sinograms, use_disk=params.cache_filters)
+
+    return backproject(filtered, axis, angles, size=size)
+
+
+# Shared memory of the worker processes, set by _init_worker
+_SHARED = {}
+
+
+def _init_worker(sinograms, slices, params):
+    _SHARED['sinograms'] = sinograms
+    _SHARED['slices'] = slices
+    _SHARED['params'] = params
+
+
+def _reconstruct_shared(task):
+    """Reconstruct the sinograms at *first*, ..., *first* + *count* - 1 of buffer *slot* of the
+    shared sinograms into the same place of the shared slices.
+    """
+    slot, first, count, sinogram_shape, slice_shape = task
+    sinograms = np.frombuffer(_SHARED['sinograms'][slot], dtype=np.float32)
+    sinograms = sinograms.reshape((-1, ) + sinogram_shape)[first:first + count]
+    slices = np.frombuffer(_SHARED['slices'][slot], dtype=np.float32)
+    slices = slices.reshape((-1, ) + slice_shape)
+    slices[first:first + count] = reconstruct(sinograms, _SHARED['params'])
+
+
+def reconstruct_parallel(batches, params, write, workers):
+    """Reconstruct the sinogram *batches* of at most :data:`SLICE_BATCH` sinograms, e.g. from
+    :func:`read_sinograms`, with *workers* processes and pass the slices in order to *write*.
+
+    Each worker reconstructs one batch at a time. The sinograms and slices are exchanged via two
+    sets of buffers in shared memory instead of pickling, the main process reads the next
+    *workers* batches into one set while the workers reconstruct the other. The buffers hold
+    2 * *workers* * :data:`SLICE_BATCH` sinograms and slices.
+    """
+    from multiprocessing import Pool
+    from multiprocessing.sharedctypes import RawArray
+
+    batches = iter(batches)
+    first_batch = next(batches, None)
+    if first_batch is None:
+        return
+
+    sinogram_shape = first_batch.shape[1:]
+    num_projections, width = sinogram_shape
+    size = get_geometry(params, width, num_projections)[2]
+    slice_shape = (size, size)
+    capacity = workers * SLICE_BATCH
+    shared_sinograms = [RawArray('f', capacity * num_projections * width) for i in range(2)]
+    shared_slices = [RawArray('f', capacity * size * size) for i in range(2)]
+
+    def get_chunks():
+        chunk = [first_batch]
+        for batch in batches:
+            if len(chunk) == workers:
+                yield chunk
+                chunk = []
+            chunk.append(batch)
+        yield chunk
+
+    def write_chunk(result, slot, count):
+        result.get()
+        slices = np.frombuffer(shared_slices[slot], dtype=np.float32)
+        for image in slices.reshape((-1, ) + slice_shape)[:count]:
+            write(image)
+
+    pool = Pool(workers, initializer=_init_worker,
+                initargs=(shared_sinograms, shared_slices, params))
+    try:
+        pending = None
+        for i, chunk in enumerate(get_chunks()):
+            slot = i % 2
+            buffer = np.frombuffer(shared_sinograms[slot], dtype=np.float32)
+            buffer = buffer.reshape((-1, ) + sinogram_shape)
+            tasks = []
+            first = 0
+            for batch in chunk:
+                if batch.shape[1:] != sinogram_shape:
+                    raise ValueError('All sinograms must have the same shape')
+                buffer[first:first + len(batch)] = batch
+                tasks.append((slot, first, len(batch), sinogram_shape, slice_shape))
+                first += len(batch)
+            result = pool.map_async(_reconstruct_shared, tasks, chunksize=1)
+            if pending:
+                write_chunk(*pending)
+            pending = (result, slot, first)
+        write_chunk(*pending)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def tomo(params):
+    """Reconstruct the slices specified by *params* with filtered backprojection and return the
+    run time in seconds. With --workers other than 1 the slices are reconstructed by that many
+    processes, see :func:`reconstruct_parallel`.
+    """
+    from multiprocessing import cpu_count
+
+    if params.method != 'fbp':
+        raise ValueError("The numpy backend only supports --method=fbp")
+
+    workers = params.workers or cpu_count()
+    start = time.time()
+
+    with SliceWriter(params) as writer:
+        if workers > 1:
+            LOG.debug("Reconstruct with {} processes".format(workers))
+            reconstruct_parallel(read_sinograms(params), params, writer.write, workers)
+        else:
+            for sinograms in read_sinograms(params):
+                for image in reconstruct(sinograms, params):
+                    writer.write(image)
+
+    return time.time() - start
+
+
+def benchmark_workers(workers=None, num_slices=64, width=512, num_projections=512,
+                      verbose=True):
+    """Measure how the reconstruction of *num_slices* random sinograms of *width* x
+    *num_projections* pixels scales with the number of worker processes. *workers* is a list of
+    process counts and defaults to the powers of two up to the number of CPUs. The slices are
+    discarded. Return a list of tuples (workers, seconds).
+    """
+    from multiprocessing import cpu_count
+    from tofu.config import TomoParams
+
+    if workers is None:
+        workers = [2 ** i for i in range(int(np.log2(cpu_count())) + 1)]
+
+    params = TomoParams().get_defaults()
+    sinograms = np.random.random((SLICE_BATCH, num_projections, width)).astype(np.float32)
+    num_batches = max(1, num_slices // SLICE_BATCH)
+
+    def discard(image):
+        pass
+
+    results = []
+    for count in workers:
+        start = time.time()
+        batches = (sinograms for i in range(num_batches))
+        if count > 1:
+            reconstruct_parallel(batches, params, discard, count)
+        else:
+            for batch in batches:
+                reconstruct(batch, params)
+        results.append((count, time.time() - start))
+
+    if verbose:
+        print('workers  seconds  speedup')
+        for count, duration in results:
+            print('{:7d}  {:7.2f}  {:7.2f}'.format(count, duration, results[0][1] / duration))
+
+    return results
@@ -1,7 +1,9 @@
 """Flat field correction."""
 import logging
 from gi.repository import Ufo
-from tofu.util import get_filenames, set_node_props, make_subargs
+from tofu.formats import get_raw_options
+from tofu.util import (get_filenames, set_node_props, make_subargs, setup_binning,
+                       setup_read_task)
 
 
 LOG = logging.getLogger(__name__)
@@ -13,6 +15,7 @@ def create_pipeline(args, graph):
     for further pipelining.
     """
     pm = Ufo.PluginManager()
+    raw_options = get_raw_options(args)
 
     def get_task(name, **kwargs):
         """Get task *name* with properties *kwargs*."""
@@ -20,29 +23,33 @@ def create_pipeline(args, graph):
         task.set_properties(**kwargs)
         return task
 
-    reader = get_task('read', path=args.input)
-    dark_reader = get_task('read', path=args.darks)
-    flat_before_reader = get_task('read', path=args.flats)
+    def get_reader(path, props):
+        """Get read task for *path* with properties from *props*, followed by binning."""
+        task = pm.get_task('read')
+        setup_read_task(task, path, **raw_options)
+        set_node_props(task, props)
+        return setup_binning(pm, graph, task, args.bin)
+
+    roi_args = make_subargs(args, ['y', 'height', 'y_step'])
+    reader = get_reader(args.input, args)
+    dark_reader = get_reader(args.darks, roi_args)
+    flat_before_reader = get_reader(args.flats, roi_args)
     ffc = get_task('flat-field-correct', dark_scale=args.dark_scale,
                    absorption_correct=args.absorptivity,
                    fix_nan_and_inf=args.fix_nan_and_inf)
     mode = args.reduction_mode.lower()
-    roi_args = make_subargs(args, ['y', 'height', 'y_step'])
-    set_node_props(reader, args)
-    set_node_props(dark_reader, roi_args)
-    set_node_props(flat_before_reader, roi_args)
 
     LOG.debug("Doing flat field correction using reduction mode `{}'".format(mode))
 
     if args.flats2:
-        flat_after_reader = get_task('read', path=args.flats2)
-        set_node_props(flat_after_reader, roi_args)
-        flat_interpolate = get_task('interpolate', number=len(get_filenames(args.input)))
+        flat_after_reader = get_reader(args.flats2, roi_args)
+        flat_interpolate = get_task('interpolate',
+                                    number=len(get_filenames(args.input, **raw_options)))
 
     if mode == 'median':
-        dark_stack = get_task('stack', number=len(get_filenames(args.darks)))
+        dark_stack = get_task('stack', number=len(get_filenames(args.darks, **raw_options)))
         dark_reduced = get_task('flatten', mode='median')
-        flat_before_stack = get_task('stack', number=len(get_filenames(args.flats)))
+        flat_before_stack = get_task('stack', number=len(get_filenames(args.flats, **raw_options)))
         flat_before_reduced = get_task('flatten', mode='median')
 
         graph.connect_nodes(dark_reader, dark_stack)
@@ -51,7 +58,8 @@ def create_pipeline(args, graph):
         graph.connect_nodes(flat_before_stack, flat_before_reduced)
 
         if args.flats2:
-            flat_after_stack = get_task('stack', number=len(get_filenames(args.flats2)))
+            flat_after_stack = get_task('stack',
+                                        number=len(get_filenames(args.flats2, **raw_options)))
             flat_after_reduced = get_task('flatten', mode='median')
             graph.connect_nodes(flat_after_reader, flat_after_stack)
             graph.connect_nodes(flat_after_stack, flat_after_reduced)
@@ -0,0 +1,226 @@
+"""Raw binary and HDF5 image stacks.
+
+Besides directories of TIFF and EDF files, input and output can be a single raw file (``*.raw``)
+holding images of the shape, data type and header offset given by --raw-shape, --raw-dtype and
+--raw-offset, or an HDF5 dataset specified as ``file.h5:/path/to/dataset``. A single image of such
+a stack is referred to as ``<stack>#<index>``, which is what get_filenames returns for stacks.
+"""
+import os
+import re
+
+
+# Default layout of raw files
+RAW_DEFAULTS = {'raw_shape': None, 'raw_dtype': 'float32', 'raw_offset': 0}
+
+# Stacks opened for reading, keyed by path and layout, until close_all is called
+_STACKS = {}
+
+
+def get_raw_options(args):
+    """Return the raw file layout given by the raw_shape, raw_dtype and raw_offset attributes of
+    *args* as a dictionary of keyword arguments for :func:`open_stack` and the reading functions
+    of :mod:`tofu.util`. Missing attributes default to :data:`RAW_DEFAULTS`.
+    """
+    options = dict(RAW_DEFAULTS)
+    for name in options:
+        value = getattr(args, name, None)
+        if value is not None:
+            options[name] = value
+
+    return options
+
+
+def split_hdf5_path(path):
+    """Split *path* of the form file.h5:/dataset into a tuple (filename, dataset). Return None if
+    *path* does not specify an HDF5 dataset.
+    """
+    match = re.match(r'^(.+\.(?:h5|hdf5|hdf|nxs)):(/.*)$', path, re.IGNORECASE)
+    return match.groups() if match else None
+
+
+def is_raw(path):
+    """Return True if *path* is a raw file."""
+    return path.lower().endswith('.raw')
+
+
+def is_stack(path):
+    """Return True if *path* is a raw file or an HDF5 dataset."""
+    return is_raw(path) or split_hdf5_path(path) is not None
+
+
+def split_reference(reference):
+    """Split image *reference* of the form <stack>#<index> into a tuple (stack, index). Return
+    (*reference*, None) if it does not refer to an image of a stack.
+    """
+    match = re.match(r'^(.+)#(\d+)$', reference)
+    if match and is_stack(match.group(1)):
+        return (match.group(1), int(match.group(2)))
+
+    return (reference, None)
+
+
+def open_stack(path, raw_shape=None, raw_dtype='float32', raw_offset=0):
+    """Return a RawStack or HDF5Stack for *path*, reusing already opened ones. Raw files hold
+    images of *raw_shape* (width, height) and *raw_dtype* starting at *raw_offset* bytes.
+    """
+    if is_raw(path):
+        key = (path, raw_shape, raw_dtype, raw_offset, os.path.getsize(path))
+    else:
+        key = path
+
+    if key not in _STACKS:
+        if is_raw(path):
+            _STACKS[key] = RawStack(path, shape=raw_shape, dtype=raw_dtype, offset=raw_offset)
+        else:
+            _STACKS[key] = HDF5Stack(path)
+
+    return _STACKS[key]
+
+
+def close_all():
+    """Close all stacks opened by :func:`open_stack`. Commands call this when they finish."""
+    for stack in _STACKS.values():
+        stack.close()
+    _STACKS.clear()
+
+
+def open_writer(path, append=False):
+    """Return a RawWriter or HDF5Writer for *path* or None if it is not a stack."""
+    if is_raw(path):
+        return RawWriter(path, append=append)
+    if split_hdf5_path(path):
+        return HDF5Writer(path, append=append)
+
+    return None
+
+
+class RawStack(object):
+
+    """Stack of equally shaped images stored one after another in a raw file, accessed via
+    numpy.memmap. The images have *shape* (width, height) and *dtype* and start at *offset* bytes.
+    """
+
+    def __init__(self, filename, shape=None, dtype='float32', offset=0):
+        import numpy as np
+
+        if not shape:
+            raise ValueError("--raw-shape must be specified for raw file '{}'".format(filename))
+
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.offset = offset
+        width, height = shape
+        count = (os.path.getsize(filename) - self.offset) // (width * height * self.dtype.itemsize)
+        self.shape = (count, height, width)
+        self._data = np.memmap(filename, dtype=self.dtype, mode='r', offset=self.offset,
+                               shape=self.shape) if count else None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read(self, index=0, y=0, height=None, y_step=1):
+        """Return rows of image *index* starting at *y* with *height* rows (all rows until the end
+        if None), taking every *y_step*-th row, as a memory mapped array.
+        """
+        y_end = None if height is None else y + height
+        return self._data[index, y:y_end:y_step]
+
+    def close(self):
+        self._data = None
+
+
+class HDF5Stack(object):
+
+    """Stack of images stored in a 3D (or a single image in a 2D) HDF5 dataset. Requires h5py."""
+
+    def __init__(self, path):
+        import h5py
+
+        filename, dataset = split_hdf5_path(path)
+        self._file = h5py.File(filename, 'r')
+        self._dataset = self._file[dataset]
+        shape = self._dataset.shape
+        if len(shape) not in (2, 3):
+            raise ValueError("Dataset '{}' is not an image stack".format(path))
+
+        self.shape = shape if len(shape) == 3 else (1,) + shape
+        self.dtype = self._dataset.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read(self, index=0, y=0, height=None, y_step=1):
+        """Return rows of image *index* starting at *y* with *height* rows (all rows until the end
+        if None), taking every *y_step*-th row. Whole chunks are read from the dataset such that
+        HDF5 decompresses every chunk only once.
+        """
+        dataset = self._dataset
+        rows = self.shape[1]
+        y_end = rows if height is None else min(y + height, rows)
+        chunk_height = dataset.chunks[-2] if dataset.chunks else 1
+        start = y // chunk_height * chunk_height
+        stop = min(-(-y_end // chunk_height) * chunk_height, rows)
+        selection = (slice(start, stop),) if dataset.ndim == 2 else (index, slice(start, stop))
+
+        return dataset[selection][y - start:y_end - start:y_step]
+
+    def close(self):
+        self._file.close()
+
+
+class RawWriter(object):
+
+    """Write images one after another to a raw file."""
+
+    def __init__(self, filename, append=False):
+        self._file = open(filename, 'ab' if append else 'wb')
+
+    def write(self, image):
+        """Append *image* to the file."""
+        import numpy as np
+        np.ascontiguousarray(image).tofile(self._file)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HDF5Writer(object):
+
+    """Write images to a resizable HDF5 dataset chunked by image. Requires h5py."""
+
+    def __init__(self, path, append=False, compression=None):
+        import h5py
+
+        filename, self._name = split_hdf5_path(path)
+        self._file = h5py.File(filename, 'a')
+        self._compression = compression
+        if self._name in self._file and not append:
+            del self._file[self._name]
+        self._dataset = self._file[self._name] if self._name in self._file else None
+
+    def write(self, image):
+        """Append *image* to the dataset, which is created by the first image."""
+        if self._dataset is None:
+            height, width = image.shape
+            self._dataset = self._file.create_dataset(self._name, shape=(0, height, width),
+                                                      maxshape=(None, height, width),
+                                                      chunks=(1, height, width), dtype=image.dtype,
+                                                      compression=self._compression)
+        count = self._dataset.shape[0]
+        self._dataset.resize(count + 1, axis=0)
+        self._dataset[count] = image
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
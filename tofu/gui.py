@@ -6,7 +6,7 @@ import pkg_resources
 
 from argparse import ArgumentParser
 from contextlib import contextmanager
-from . import reco, config, tifffile, util
+from . import reco, config, formats, util
 import tofu.vis.qt
 from PyQt4 import QtGui, QtCore, uic
 
@@ -390,9 +390,9 @@ class ApplicationWindow(QtGui.QMainWindow):
                 self.ui.centralWidget.setEnabled(True)
                 return
 
-            im = util.read_image(input_images[0])
-            self.params.width = im.shape[1]
-            self.params.height = im.shape[0]
+            raw_options = formats.get_raw_options(self.params)
+            self.params.width, self.params.height = util.probe_image(input_images[0],
+                                                                     **raw_options)[:2]
             self.params.ffc_correction = self.params.ffc_correction and self.ui.proj_button.isChecked()
 
             if self.params.y_step > 1:
@@ -450,8 +450,9 @@ class ApplicationWindow(QtGui.QMainWindow):
     def on_compute_center(self):
         first_name = str(self.ui.path_line_0.text())
         second_name = str(self.ui.path_line_180.text())
-        first = tifffile.TiffFile(first_name).asarray().astype(np.float)
-        second = tifffile.TiffFile(second_name).asarray().astype(np.float)
+        raw_options = formats.get_raw_options(self.params)
+        first = util.read_image(first_name, dtype=np.float32, **raw_options)
+        second = util.read_image(second_name, dtype=np.float32, **raw_options)
 
         self.axis = reco.compute_rotation_axis(first, second)
         self.height, self.width = first.shape
@@ -0,0 +1,192 @@
+"""Persistent index of input data directories.
+
+Listing a directory with 10^4-10^5 projections and parsing image headers is slow on network
+filesystems. The index stores the sorted file names of a directory together with the
+properties (shape, data type, data offset) of the images which have been probed so far in a
+JSON file below the cache directory (*TOFU_CACHE_DIR* environment variable or
+~/.cache/tofu). Only directories listed by :func:`list_files` are indexed. The file list is
+valid as long as the modification time of the directory does not change, image properties are
+validated by the modification time and size of each file.
+"""
+import atexit
+import errno
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+LOG = logging.getLogger(__name__)
+
+VERSION = 3
+
+# Indices loaded in this process, keyed by absolute directory path
+_INDICES = {}
+
+
+def natural_key(name):
+    """Sort key for *name* that orders embedded numbers by value, e.g. 'f2' before 'f10'."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def listdir(directory):
+    """Return the names of all entries in *directory* in natural order."""
+    if scandir is None:
+        names = os.listdir(directory)
+    else:
+        names = [entry.name for entry in scandir(directory)]
+
+    return sorted(names, key=natural_key)
+
+
+def get_cache_dir(name='index'):
+    """Return the cache directory for *name*, by default the one where indices are stored."""
+    default = os.path.join(os.path.expanduser('~'), '.cache', 'tofu')
+    return os.path.join(os.environ.get('TOFU_CACHE_DIR', default), name)
+
+
+def _index_filename(directory):
+    if not isinstance(directory, bytes):
+        directory = directory.encode('utf-8')
+
+    return os.path.join(get_cache_dir(), hashlib.sha1(directory).hexdigest() + '.json')
+
+
+def _load(directory):
+    """Load the stored index of *directory*, return None if there is none."""
+    try:
+        with open(_index_filename(directory)) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if index.get('version') != VERSION or index.get('directory') != directory:
+        return None
+
+    return index
+
+
+def _save(index):
+    """Store *index* atomically, errors are only logged."""
+    index = dict((k, v) for k, v in index.items() if k != 'dirty')
+    # Changes within the timestamp resolution could be missed, so don't store racy listings
+    if index['mtime'] is not None and time.time() - index['mtime'] < 2:
+        index['mtime'] = None
+
+    filename = _index_filename(index['directory'])
+    tmp_name = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(tmp_name, 'w') as f:
+            json.dump(index, f)
+        os.rename(tmp_name, filename)
+    except (IOError, OSError) as e:
+        LOG.debug("Cannot store index of '{}': {}".format(index['directory'], e))
+
+
+@atexit.register
+def _save_dirty():
+    for index in _INDICES.values():
+        if index.get('dirty'):
+            _save(index)
+            index['dirty'] = False
+
+
+def get_index(directory):
+    """Return the index of *directory*, which is a dictionary with the sorted file names stored
+    under 'files', the directory modification time they are valid for under 'mtime' and the
+    already probed image properties under 'images'.
+    """
+    directory = os.path.abspath(directory)
+    index = _INDICES.get(directory)
+
+    if index is None:
+        index = _load(directory)
+        if index is None:
+            index = {'version': VERSION, 'directory': directory, 'mtime': None, 'files': [],
+                     'images': {}}
+        _INDICES[directory] = index
+
+    return index
+
+
+def list_files(directory):
+    """Return the naturally sorted names of all entries in *directory* which do not start with a
+    dot, like glob with the '*' pattern.
+    """
+    index = get_index(directory)
+    mtime = os.stat(directory).st_mtime
+
+    if index['mtime'] != mtime:
+        LOG.debug("Indexing '{}'".format(index['directory']))
+        index['files'] = listdir(directory)
+        index['mtime'] = mtime
+        _save(index)
+
+    return [name for name in index['files'] if not name.startswith('.')]
+
+
+def is_indexed(filename):
+    """Return True if the directory of *filename* has been indexed, see :func:`list_files`."""
+    return os.path.dirname(os.path.abspath(filename)) in _INDICES
+
+
+def image_info(filename):
+    """Return the properties of image *filename* as a tuple (width, height, dtype, num_pages,
+    offset), where *dtype* is a numpy dtype string including the byte order and *offset* the
+    position of the image data in the file or None if the data is not stored in one contiguous
+    uncompressed block. The properties are only stored in the index of the directory if it has
+    been listed by :func:`list_files` and are validated by the modification time and size of the
+    file.
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    index = _INDICES.get(directory)
+    stat = os.stat(filename)
+    info = index['images'].get(name) if index else None
+
+    if info is None or info[:2] != [stat.st_mtime, stat.st_size]:
+        info = [stat.st_mtime, stat.st_size] + _probe(filename)
+        # Changes within the timestamp resolution could be missed, so don't store racy entries
+        if index is not None and time.time() - stat.st_mtime >= 2:
+            index['images'][name] = info
+            index['dirty'] = True
+
+    return tuple(info[2:])
+
+
+def _probe(filename):
+    """Return the properties of image *filename* as a list, see :func:`image_info`."""
+    from tofu.util import probe_image, read_edf_header
+
+    width, height, dtype, num_pages = probe_image(filename)
+    offset = None
+
+    if filename.lower().endswith('.tif'):
+        from tofu.tifffile import TiffLayout
+        try:
+            layout = TiffLayout(filename)
+            if layout.shape == (height, width):
+                dtype = layout.dtype
+                offset = layout.offset
+        except Exception:
+            pass
+    elif '.edf' in filename.lower():
+        header, header_size = read_edf_header(filename)
+        if header.get('Compression', 'None') == 'None':
+            offset = header_size
+
+    return [width, height, dtype.str, num_pages, offset]
@@ -1,28 +1,34 @@
 import os
-import re
 import logging
-import glob
 import tempfile
 import sys
 import numpy as np
-from gi.repository import Ufo
-from tofu.flatcorrect import create_pipeline
-from tofu.util import set_node_props, get_filenames, next_power_of_two, read_image, determine_shape
+from tofu import fbp, formats
+from tofu.util import (set_node_props, get_filenames, get_output_name, get_padding, read_image,
+                       determine_shape, setup_binning, setup_read_task)
+
+try:
+    from gi.repository import Ufo
+    from tofu.flatcorrect import create_pipeline
+except ImportError:
+    # Only the numpy backend can be used without UFO
+    Ufo = None
 
 
 LOG = logging.getLogger(__name__)
 
 
-def get_output_name(output_path):
-    abs_path = os.path.abspath(output_path)
+def check_ufo():
+    if Ufo is None:
+        sys.exit("UFO is not available, use --backend=numpy for CPU reconstruction")
 
-    if re.search(r"%[0-9]*i", output_path):
-        return abs_path
 
-    return os.path.join(abs_path, 'slice-%05i.tif')
+def tomo(params):
+    if params.backend == 'numpy':
+        return fbp.tomo(params)
 
+    check_ufo()
 
-def tomo(params):
     # Create reader and writer
     pm = Ufo.PluginManager()
 
@@ -31,10 +37,14 @@ def tomo(params):
         task.set_properties(**kwargs)
         return task
 
+    g = Ufo.TaskGraph()
+    raw_options = formats.get_raw_options(params)
     reader = get_task('read')
-    reader.props.path = params.input
+    setup_read_task(reader, params.input, **raw_options)
     set_node_props(reader, params)
     width, height = determine_shape(params)
+    if params.bin > 1 and width and height:
+        width, height = width // params.bin, height // params.bin
 
     if params.dry_run:
         writer = get_task('null')
@@ -44,13 +54,14 @@ def tomo(params):
         LOG.debug("Write to {}".format(outname))
 
     # Setup graph depending on the chosen method and input data
-    g = Ufo.TaskGraph()
+    if not (params.from_projections and params.darks and params.flats):
+        reader = setup_binning(pm, g, reader, params.bin)
 
     if params.from_projections:
         if params.number:
             count = len(range(params.start, params.start + params.number, params.step))
         else:
-            count = len(get_filenames(params.input))
+            count = len(get_filenames(params.input, **raw_options))
 
         LOG.debug("num_projections = {}".format(count))
         sino_output = get_task('transpose-projections', number=count)
@@ -73,10 +84,12 @@ def tomo(params):
         bp = get_task('backproject')
 
         if params.axis:
-            bp.props.axis_pos = params.axis
+            bp.props.axis_pos = params.axis / params.bin
 
         if params.angle:
-            bp.props.angle_step = params.angle
+            # Binned sinograms have fewer projections
+            angle_factor = params.bin if not params.from_projections else 1
+            bp.props.angle_step = params.angle * angle_factor
 
         if params.offset:
             bp.props.angle_offset = params.offset
@@ -97,7 +110,7 @@ def tomo(params):
             g.connect_nodes(crop, bp)
         else:
             if params.crop_width:
-                ifft.props.crop_width = int(params.crop_width)
+                ifft.props.crop_width = int(params.crop_width) // params.bin
                 LOG.debug("Cropping to {} pixels".format(ifft.props.crop_width))
 
             g.connect_nodes(sino_output, fft)
@@ -156,6 +169,8 @@ def tomo(params):
 
 
 def lamino(params):
+    check_ufo()
+
     # Create reader and writer
     pm = Ufo.PluginManager()
 
@@ -179,18 +194,20 @@ def lamino(params):
     if not (width and height):
         raise ValueError('Both width and height must be specified')
     pad_width, pad_height = params.pad
+    # Binning on read and downsampling both reduce the projection size
+    factor = params.downsample * params.bin
 
-    xpad = (pad_width - width) / 2 / params.downsample
-    ypad = (pad_height - height) / 2 / params.downsample
+    xpad = (pad_width - width) / 2 / factor
+    ypad = (pad_height - height) / 2 / factor
 
     pad.set_properties(xl=xpad, xr=xpad, yt=ypad, yb=ypad, mode='brep')
-    ramp.set_properties(width=pad_width / params.downsample,
-                        height=pad_height / params.downsample,
+    ramp.set_properties(width=pad_width / factor,
+                        height=pad_height / factor,
                         fwidth=vx, theta=params.tilt, tau=params.tau)
 
     rec.set_properties(theta=params.tilt, angle_step=params.angle, psi=params.psi,
-                       proj_ox=params.axis[0] / params.downsample,
-                       proj_oy=params.axis[1] / params.downsample,
+                       proj_ox=params.axis[0] / factor,
+                       proj_oy=params.axis[1] / factor,
                        vol_sx=vx, vol_sy=vy, vol_sz=vz,
                        vol_ox=vx / 2, vol_oy=vy / 2, vol_oz=vz / 2)
 
@@ -205,8 +222,8 @@ def lamino(params):
     else:
         radios = pm.get_task('read')
         set_node_props(radios, params)
-        radios.set_properties(path=params.input)
-        first = radios
+        setup_read_task(radios, params.input, **formats.get_raw_options(params))
+        first = setup_binning(pm, g, radios, params.bin)
 
     # Padding and filtering
     if params.downsample > 1:
@@ -233,71 +250,181 @@ def lamino(params):
 def estimate_center(params):
     if params.estimate_method == 'reconstruction':
         axis = estimate_center_by_reconstruction(params)
+    elif params.estimate_method == 'coarse-to-fine':
+        axis = estimate_center_coarse_to_fine(params)
     else:
         axis = estimate_center_by_correlation(params)
 
     return axis
 
 
-def estimate_center_by_reconstruction(params):
-    if params.from_projections:
-        sys.exit("Cannot estimate axis from projections")
+class AxisScorer(object):
 
-    sinos = sorted(glob.glob(os.path.join(params.input, '*.tif')))
+    """Score trial axis positions by the integral absolute value Q_IA of slices reconstructed from
+    one sinogram of *params.input*, lower is better. With the numpy backend the sinogram is read
+    and filtered once per binning and all trials of a call are reconstructed in one pass in
+    memory, otherwise every trial is reconstructed by :func:`tomo` via a temporary file.
+    """
 
-    if not sinos:
-        sys.exit("No sinograms found in {}".format(params.input))
+    def __init__(self, params):
+        if params.from_projections:
+            sys.exit("Cannot estimate axis from projections")
+
+        sinos = get_filenames(os.path.join(params.input, '*.tif'))
+
+        if not sinos:
+            sys.exit("No sinograms found in {}".format(params.input))
+
+        # Use a sinogram that probably has some interesting data
+        filename = sinos[len(sinos) / 2]
+        sinogram = read_image(filename)
+        self.width = sinogram.shape[1]
+        self.m0 = np.mean(np.sum(sinogram, axis=1))
+        self.params = params
+        self.bin = params.bin
+        self.num_reconstructions = {}
+        self._filtered = {}
+        self._tmp_dir = None
+
+        params.input = filename
+
+        if params.backend != 'numpy':
+            self._tmp_dir = tempfile.mkdtemp()
+            params.output = os.path.join(self._tmp_dir, 'slice-%i.tif')
+
+    def reconstruct(self, guesses, binning=1):
+        """Return slices reconstructed for axis positions *guesses* from the sinogram binned by
+        *binning* in addition to --bin.
+        """
+        params = self.params
+        params.bin = self.bin * binning
+        self.num_reconstructions[binning] = self.num_reconstructions.get(binning, 0) + len(guesses)
+
+        try:
+            if params.backend == 'numpy':
+                if binning not in self._filtered:
+                    sinogram = next(fbp.read_sinograms(params))[:1]
+                    filtered = fbp.filter_sinograms(sinogram, use_disk=params.cache_filters)
+                    self._filtered[binning] = filtered[0]
+                return fbp.reconstruct_axes(self._filtered[binning], guesses, params)
+
+            results = []
+            for guess in guesses:
+                # Run reconstruction with new guess
+                params.axis = guess
+                tomo(params)
+                results.append(read_image(os.path.join(self._tmp_dir, 'slice-0.tif')))
+            return results
+        finally:
+            params.bin = self.bin
+
+    def score(self, guesses, binning=1):
+        """Return the scores of axis positions *guesses*, see :meth:`reconstruct`."""
+        def heaviside(A):
+            return (A >= 0.0) * 1.0
+
+        scores = []
+        for result in self.reconstruct(guesses, binning=binning):
+            # Analyse reconstructed slice
+            Q_IA = float(np.sum(np.abs(result)) / self.m0)
+            Q_IN = float(-np.sum(result * heaviside(-result)) / self.m0)
+            LOG.info("Q_IA={}, Q_IN={}".format(Q_IA, Q_IN))
+            scores.append(Q_IA)
+
+        return scores
+
+    def best_center(self, center, width, binning=1):
+        """Return the best of five trials spaced by *width* / 4 around *center*."""
+        trials = [center + (width / 4.0) * x for x in range(-2, 3)]
+        scores = zip(trials, self.score(trials, binning=binning))
+        LOG.info(scores)
+        best = sorted(scores, cmp=lambda x, y: cmp(x[1], y[1]))
+        return best[0][0]
 
-    # Use a sinogram that probably has some interesting data
-    filename = sinos[len(sinos) / 2]
-    sinogram = read_image(filename)
-    initial_width = sinogram.shape[1]
-    m0 = np.mean(np.sum(sinogram, axis=1))
+    def close(self):
+        if self._tmp_dir:
+            tmp_output = os.path.join(self._tmp_dir, 'slice-0.tif')
+            try:
+                os.remove(tmp_output)
+                os.removedirs(self._tmp_dir)
+            except OSError:
+                LOG.info("Could not remove {} or {}".format(tmp_output, self._tmp_dir))
 
-    center = initial_width / 2.0
-    width = initial_width / 2.0
-    new_center = center
-    tmp_dir = tempfile.mkdtemp()
-    tmp_output = os.path.join(tmp_dir, 'slice-0.tif')
+    def __enter__(self):
+        return self
 
-    params.input = filename
-    params.output = os.path.join(tmp_dir, 'slice-%i.tif')
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    def heaviside(A):
-        return (A >= 0.0) * 1.0
 
-    def get_score(guess, m0):
-        # Run reconstruction with new guess
-        params.axis = guess
-        tomo(params)
+def estimate_center_by_reconstruction(params):
+    with AxisScorer(params) as scorer:
+        new_center = scorer.width / 2.0
+        width = scorer.width / 2.0
 
-        # Analyse reconstructed slice
-        result = read_image(tmp_output)
-        Q_IA = float(np.sum(np.abs(result)) / m0)
-        Q_IN = float(-np.sum(result * heaviside(-result)) / m0)
-        LOG.info("Q_IA={}, Q_IN={}".format(Q_IA, Q_IN))
-        return Q_IA
+        for i in range(params.num_iterations):
+            LOG.info("Estimate iteration: {}".format(i))
+            new_center = scorer.best_center(new_center, width)
+            LOG.info("Currently best center: {}".format(new_center))
+            width /= 2.0
+
+    return new_center
 
-    def best_center(center, width):
-        trials = [center + (width / 4.0) * x for x in range(-2, 3)]
-        scores = [(guess, get_score(guess, m0)) for guess in trials]
-        LOG.info(scores)
-        best = sorted(scores, cmp=lambda x, y: cmp(x[1], y[1]))
-        return best[0][0]
 
-    for i in range(params.num_iterations):
-        LOG.info("Estimate iteration: {}".format(i))
-        new_center = best_center(new_center, width)
-        LOG.info("Currently best center: {}".format(new_center))
-        width /= 2.0
+def estimate_center_coarse_to_fine(params):
+    """Estimate the center of rotation with a coarse search on a sinogram binned by
+    --coarse-bin, where five trials around the best position are scored with halving spacing
+    until it reaches the binned pixel size. The result is then refined on full resolution by a
+    golden-section search for the minimum Q_IA between the neighbouring trials, until the
+    position is known within --axis-tolerance pixels.
+    """
+    with AxisScorer(params) as scorer:
+        binning = params.coarse_bin
+        center = scorer.width / 2.0
+        spacing = scorer.width / 8.0
 
-    try:
-        os.remove(tmp_output)
-        os.removedirs(tmp_dir)
-    except OSError:
-        LOG.info("Could not remove {} or {}".format(tmp_output, tmp_dir))
+        while True:
+            center = scorer.best_center(center, 4 * spacing, binning=binning)
+            LOG.info("Coarse center: {}".format(center))
+            if spacing <= binning:
+                break
+            spacing /= 2.0
+
+        center = golden_section_search(lambda x: scorer.score([x])[0], center - spacing,
+                                       center + spacing, params.axis_tolerance)
+        LOG.info("Reconstructions per binning: {}".format(scorer.num_reconstructions))
+
+    return center
 
-    return new_center
+
+def golden_section_search(func, low, high, tolerance):
+    """Return the position of the minimum of *func*, which must be unimodal between *low* and
+    *high*, within *tolerance*, which must be positive. *func* is evaluated at most
+    log(width / tolerance) / log(1.618) + 2 times for an initial interval of *width*.
+    """
+    if tolerance <= 0:
+        raise ValueError('Tolerance must be positive')
+
+    ratio = (np.sqrt(5) - 1) / 2
+    num_iterations = max(0, int(np.ceil(np.log((high - low) / tolerance) / -np.log(ratio))))
+    x_1 = high - ratio * (high - low)
+    x_2 = low + ratio * (high - low)
+    f_1 = func(x_1)
+    f_2 = func(x_2)
+
+    for i in range(num_iterations):
+        if high - low <= tolerance:
+            break
+        if f_1 < f_2:
+            high, x_2, f_2 = x_2, x_1, f_1
+            x_1 = high - ratio * (high - low)
+            f_1 = func(x_1)
+        else:
+            low, x_1, f_1 = x_1, x_2, f_2
+            x_2 = low + ratio * (high - low)
+            f_2 = func(x_2)
+
+    return (low + high) / 2.0
 
 
 def estimate_center_by_correlation(params):
@@ -311,22 +438,27 @@ def estimate_center_by_correlation(params):
 
         return np.log(result)
 
-    first = read_image(get_filenames(params.input)[0]).astype(np.float)
+    raw_options = formats.get_raw_options(params)
+
+    def read_rows(filename):
+        return read_image(filename, y=params.y, height=params.height, y_step=params.y_step,
+                          dtype=np.float32, binning=params.bin, **raw_options)
+
+    def get_filename(path, index=0):
+        return get_filenames(path, **raw_options)[index]
+
+    first = read_rows(get_filename(params.input))
     last_index = params.start + params.number if params.number else -1
-    last = read_image(get_filenames(params.input)[last_index]).astype(np.float)
+    last = read_rows(get_filename(params.input, last_index))
 
     if params.darks and params.flats:
-        dark = read_image(get_filenames(params.darks)[0]).astype(np.float)
-        flat = read_image(get_filenames(params.flats)[0]) - dark
+        dark = read_rows(get_filename(params.darks))
+        flat = read_rows(get_filename(params.flats)) - dark
         first = flat_correct(flat, first - dark)
         last = flat_correct(flat, last - dark)
 
-    height = params.height if params.height else -1
-    y_region = slice(params.y, min(params.y + height, first.shape[0]), params.y_step)
-    first = first[y_region, :]
-    last = last[y_region, :]
-
-    return compute_rotation_axis(first, last)
+    # Axis position in full resolution pixels
+    return compute_rotation_axis(first, last) * params.bin
 
 
 def compute_rotation_axis(first_projection, last_projection):
@@ -351,15 +483,15 @@ def compute_rotation_axis(first_projection, last_projection):
 
 
 def setup_padding(pad, crop, width, height):
-    padding = next_power_of_two(width + 32) - width
-    pad.props.width = width + padding
+    padded_width, x = get_padding(width)
+    pad.props.width = padded_width
     pad.props.height = height
-    pad.props.x = padding / 2
+    pad.props.x = x
     pad.props.y = 0
     pad.props.addressing_mode = 'clamp_to_edge'
 
     # crop to original width after filtering
     crop.props.width = width
     crop.props.height = height
-    crop.props.x = padding / 2
+    crop.props.x = x
     crop.props.y = 0
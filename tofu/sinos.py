@@ -1,7 +1,9 @@
 """Sinogram generation module."""
 from gi.repository import Ufo
 from tofu.flatcorrect import create_pipeline as create_flat_corr_pipeline
-from tofu.util import set_node_props, get_filenames, determine_shape
+from tofu.formats import get_raw_options
+from tofu.util import (set_node_props, get_filenames, determine_shape, setup_binning,
+                       setup_read_task)
 
 
 def make_sinos(args):
@@ -35,20 +37,22 @@ def create_pipeline(args, graph):
     """Create sinogram generating pipeline based on arguments from *args*."""
     pm = Ufo.PluginManager()
     sinos = pm.get_task('transpose-projections')
+    raw_options = get_raw_options(args)
 
     if args.number:
         region = (args.start, args.start + args.number, args.step)
         num_projections = len(range(*region))
     else:
-        num_projections = len(get_filenames(args.input))
+        num_projections = len(get_filenames(args.input, **raw_options))
     sinos.props.number = num_projections
 
     if args.darks and args.flats:
         start = create_flat_corr_pipeline(args, graph)
     else:
         start = pm.get_task('read')
-        start.props.path = args.input
+        setup_read_task(start, args.input, **raw_options)
         set_node_props(start, args)
+        start = setup_binning(pm, graph, start, args.bin)
 
     graph.connect_nodes(start, sinos)
 
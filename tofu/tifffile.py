@@ -138,8 +138,11 @@ from __future__ import division, print_function
 import sys
 import os
 import re
+import gc
+import types
 import glob
 import math
+import mmap
 import zlib
 import time
 import json
@@ -147,22 +150,26 @@ import struct
 import warnings
 import datetime
 import collections
+import multiprocessing
 from fractions import Fraction
 from xml.etree import cElementTree as ElementTree
+from multiprocessing.pool import ThreadPool
 
 import numpy
 
 __version__ = '2013.10.29'
 __docformat__ = 'restructuredtext en'
-__all__ = ['imsave', 'imread', 'imshow', 'TiffFile', 'TiffSequence']
+__all__ = ['imsave', 'imread', 'imshow', 'TiffFile', 'TiffWriter',
+           'TiffSequence', 'TiffVolume', 'TiffLayout']
 
 
 def imsave(filename, data, photometric=None, planarconfig=None,
            resolution=None, description=None, software='tifffile.py',
-           byteorder=None, bigtiff=False, extratags=()):
+           byteorder=None, bigtiff=False, extratags=(), compress=0,
+           predictor=None, rows_per_strip=None, maxworkers=None):
     """Write image data to TIFF file.
 
-    Image data are written uncompressed in one stripe per plane.
+    By default image data are written uncompressed in one stripe per plane.
     Dimensions larger than 2 or 3 (depending on photometric mode and
     planar configuration) are flattened and saved as separate pages.
     The 'sample_format' and 'bits_per_sample' TIFF tags are derived from
@@ -209,90 +216,66 @@ def imsave(filename, data, photometric=None, planarconfig=None,
             One or more values compatible with `dtype`.
         writeonce: bool
             If True the tag is written to the first page only.
+    compress : int
+        Zlib compression level between 0 (no compression) and 9.
+        Compressed data are written as 'adobe_deflate'.
+    predictor : {None, 'horizontal', 'float'}
+        Difference encode the samples in each row before compression.
+        'horizontal' applies to integer, 'float' to floating point data.
+        Requires compress > 0.
+    rows_per_strip : int
+        Number of rows in each strip. By default one strip is written per
+        plane if data are not compressed, else strips of about 64 KB.
+    maxworkers : int
+        Maximum number of threads encoding strips.
+        By default one thread per CPU is used.
 
     Examples
     --------
     >>> data = numpy.ones((2, 5, 3, 301, 219), 'float32') * 0.5
     >>> imsave('temp.tif', data)
+    >>> imsave('temp.tif', data, compress=6, predictor='float')
 
     >>> data = numpy.ones((5, 301, 219, 3), 'uint8') + 127
     >>> value = u'{"shape": %s}' % str(list(data.shape))
     >>> imsave('temp.tif', data, extratags=[(270, 's', 0, value, True)])
 
     """
-    assert(photometric in (None, 'minisblack', 'miniswhite', 'rgb'))
-    assert(planarconfig in (None, 'contig', 'planar'))
-    assert(byteorder in (None, '<', '>'))
-
-    if byteorder is None:
-        byteorder = '<' if sys.byteorder == 'little' else '>'
-
-    data = numpy.asarray(data, dtype=byteorder+data.dtype.char, order='C')
-    data_shape = shape = data.shape
-    data = numpy.atleast_2d(data)
-
-    if not bigtiff and data.size * data.dtype.itemsize < 2000*2**20:
-        bigtiff = False
-        offset_size = 4
-        tag_size = 12
-        numtag_format = 'H'
-        offset_format = 'I'
-        val_format = '4s'
-    else:
+    data = numpy.asarray(data)
+    if data.size * data.dtype.itemsize >= 2000*2**20:
         bigtiff = True
-        offset_size = 8
-        tag_size = 20
-        numtag_format = 'Q'
-        offset_format = 'Q'
-        val_format = '8s'
-
-    # unify shape of data
-    samplesperpixel = 1
-    extrasamples = 0
-    if photometric is None:
-        if data.ndim > 2 and (shape[-3] in (3, 4) or shape[-1] in (3, 4)):
-            photometric = 'rgb'
-        else:
-            photometric = 'minisblack'
-    if photometric == 'rgb':
-        if len(shape) < 3:
-            raise ValueError("not a RGB(A) image")
-        if planarconfig is None:
-            planarconfig = 'planar' if shape[-3] in (3, 4) else 'contig'
-        if planarconfig == 'contig':
-            if shape[-1] not in (3, 4):
-                raise ValueError("not a contiguous RGB(A) image")
-            data = data.reshape((-1, 1) + shape[-3:])
-            samplesperpixel = shape[-1]
-        else:
-            if shape[-3] not in (3, 4):
-                raise ValueError("not a planar RGB(A) image")
-            data = data.reshape((-1, ) + shape[-3:] + (1, ))
-            samplesperpixel = shape[-3]
-        if samplesperpixel == 4:
-            extrasamples = 1
-    elif planarconfig and len(shape) > 2:
-        if planarconfig == 'contig':
-            data = data.reshape((-1, 1) + shape[-3:])
-            samplesperpixel = shape[-1]
-        else:
-            data = data.reshape((-1, ) + shape[-3:] + (1, ))
-            samplesperpixel = shape[-3]
-        extrasamples = samplesperpixel - 1
-    else:
-        planarconfig = None
-        # remove trailing 1s
-        while len(shape) > 2 and shape[-1] == 1:
-            shape = shape[:-1]
-        data = data.reshape((-1, 1) + shape[-2:] + (1, ))
-
-    shape = data.shape  # (pages, planes, height, width, contig samples)
-
-    bytestr = bytes if sys.version[0] == '2' else (
-        lambda x: bytes(x, 'utf-8') if isinstance(x, str) else x)
-    tifftypes = {'B': 1, 's': 2, 'H': 3, 'I': 4, '2I': 5, 'b': 6,
-                 'h': 8, 'i': 9, 'f': 11, 'd': 12, 'Q': 16, 'q': 17}
-    tifftags = {
+    with TiffWriter(filename, bigtiff=bigtiff, byteorder=byteorder,
+                    software=software) as tif:
+        tif.save(data, photometric=photometric, planarconfig=planarconfig,
+                 resolution=resolution, description=description,
+                 extratags=extratags, compress=compress, predictor=predictor,
+                 rows_per_strip=rows_per_strip, maxworkers=maxworkers)
+
+
+class TiffWriter(object):
+    """Write image data to TIFF file page by page.
+
+    The file is kept open and pages are appended with each call of save,
+    e.g. for a generator of images too large to be held in memory.
+    Files are written in standard TIFF format until they would grow
+    beyond 4 GB, at which point the pages already written are converted
+    to BigTIFF.
+
+    Examples
+    --------
+    >>> with TiffWriter('temp.tif') as tif:
+    ...     for i in range(4):
+    ...         tif.save(numpy.ones((301, 219), 'uint16') * i)
+    >>> imread('temp.tif').shape
+    (4, 301, 219)
+    >>> with TiffFile('temp.tif') as tif:
+    ...     tif.series[0].shape
+    (4, 301, 219)
+
+    """
+    TYPES = {'B': 1, 's': 2, 'H': 3, 'I': 4, '2I': 5, 'b': 6,
+             'h': 8, 'i': 9, 'f': 11, 'd': 12, 'Q': 16, 'q': 17}
+    TAGS = {
         'new_subfile_type': 254, 'subfile_type': 255,
         'image_width': 256, 'image_length': 257, 'bits_per_sample': 258,
         'compression': 259, 'photometric': 262, 'fill_order': 266,
@@ -302,156 +285,392 @@ def imsave(filename, data, photometric=None, planarconfig=None,
         'planar_configuration': 284, 'page_name': 285, 'resolution_unit': 296,
         'software': 305, 'datetime': 306, 'predictor': 317, 'color_map': 320,
         'extra_samples': 338, 'sample_format': 339}
-    tags = []  # list of (code, ifdentry, ifdvalue, writeonce)
-
-    def pack(fmt, *val):
-        return struct.pack(byteorder+fmt, *val)
-
-    def addtag(code, dtype, count, value, writeonce=False):
-        # compute ifdentry and ifdvalue bytes from code, dtype, count, value
-        # append (code, ifdentry, ifdvalue, writeonce) to tags list
-        code = tifftags[code] if code in tifftags else int(code)
-        if dtype not in tifftypes:
-            raise ValueError("unknown dtype %s" % dtype)
-        if dtype == 's':
-            value = bytestr(value) + b'\0'
-            count = len(value)
-            value = (value, )
-        if len(dtype) > 1:
-            count *= int(dtype[:-1])
-            dtype = dtype[-1]
-        ifdentry = [pack('HH', code, tifftypes[dtype]),
-                    pack(offset_format, count)]
-        ifdvalue = None
-        if count == 1:
-            if isinstance(value, (tuple, list)):
-                value = value[0]
-            ifdentry.append(pack(val_format, pack(dtype, value)))
-        elif struct.calcsize(dtype) * count <= offset_size:
-            ifdentry.append(pack(val_format, pack(str(count)+dtype, *value)))
+
+    def __init__(self, filename, bigtiff=False, byteorder=None,
+                 software='tifffile.py'):
+        """Create new TIFF file for writing.
+
+        Parameters
+        ----------
+        filename : str
+            Name of file to write.
+        bigtiff : bool
+            If True the BigTIFF format is used from the start.
+        byteorder : {'<', '>'}
+            The endianness of the data in the file.
+            By default this is the system's native byte order.
+        software : str
+            Name of the software used to create the image.
+            Saved with the first page only.
+
+        """
+        assert(byteorder in (None, '<', '>'))
+        if byteorder is None:
+            byteorder = '<' if sys.byteorder == 'little' else '>'
+        self._byteorder = byteorder
+        self._software = software
+        self._pages = 0  # number of pages written
+        self._ifds = []  # tags of pages written in standard TIFF format
+        # shape description of the first page: (file position, size,
+        # shape and number of pages of the first save, all saves alike)
+        self._shape = None
+        self._fh = open(filename, 'wb')
+        self._set_format(bigtiff)
+        self._write_header()
+        # reserve space for a BigTIFF header
+        self._fh.write(b'\0' * (16 - self._fh.tell()))
+
+    def _set_format(self, bigtiff):
+        self._bigtiff = bigtiff
+        if bigtiff:
+            self._offset_size = 8
+            self._tag_size = 20
+            self._numtag_format = 'Q'
+            self._offset_format = 'Q'
+            self._val_format = '8s'
         else:
-            ifdentry.append(pack(offset_format, 0))
-            ifdvalue = pack(str(count)+dtype, *value)
-        tags.append((code, b''.join(ifdentry), ifdvalue, writeonce))
+            self._offset_size = 4
+            self._tag_size = 12
+            self._numtag_format = 'H'
+            self._offset_format = 'I'
+            self._val_format = '4s'
+
+    def _pack(self, fmt, *val):
+        return struct.pack(self._byteorder+fmt, *val)
+
+    def _write_header(self):
+        fh = self._fh
+        fh.seek(0)
+        fh.write({'<': b'II', '>': b'MM'}[self._byteorder])
+        if self._bigtiff:
+            fh.write(self._pack('HHH', 43, 8, 0))
+        else:
+            fh.write(self._pack('H', 42))
+        self._ifd_offset = fh.tell()  # position of pointer to next IFD
+        fh.write(self._pack(self._offset_format, 0))
+
+    def _ifd_size(self, tags):
+        """Return number of bytes _write_ifd writes for tags."""
+        size = (struct.calcsize(self._numtag_format) +
+                len(tags) * self._tag_size + self._offset_size)
+        for code, dtype, count, value in tags:
+            if dtype == 'offset':
+                dtype = self._offset_format
+            valuesize = struct.calcsize(self._byteorder + str(count) + dtype)
+            if valuesize > self._offset_size:
+                size += valuesize + valuesize % 2
+        return size
+
+    def _write_ifd(self, tags):
+        """Append IFD of (code, dtype, count, value) tags to file and link it.
+
+        The dtype 'offset' denotes the format of file offsets.
+        Return file positions of the values not stored in the IFD entries
+        by tag code.
 
-    def rational(arg, max_denominator=1000000):
-        # return nominator and denominator from float or two integers
-        try:
-            f = Fraction.from_float(arg)
-        except TypeError:
-            f = Fraction(arg[0], arg[1])
-        f = f.limit_denominator(max_denominator)
-        return f.numerator, f.denominator
-
-    if software:
-        addtag('software', 's', 0, software, writeonce=True)
-    if description:
-        addtag('image_description', 's', 0, description, writeonce=True)
-    elif shape != data_shape:
-        addtag('image_description', 's', 0,
-               "shape=(%s)" % (",".join('%i' % i for i in data_shape)),
-               writeonce=True)
-    addtag('datetime', 's', 0,
-           datetime.datetime.now().strftime("%Y:%m:%d %H:%M:%S"),
-           writeonce=True)
-    addtag('compression', 'H', 1, 1)
-    addtag('orientation', 'H', 1, 1)
-    addtag('image_width', 'I', 1, shape[-2])
-    addtag('image_length', 'I', 1, shape[-3])
-    addtag('new_subfile_type', 'I', 1, 0 if shape[0] == 1 else 2)
-    addtag('sample_format', 'H', 1,
-           {'u': 1, 'i': 2, 'f': 3, 'c': 6}[data.dtype.kind])
-    addtag('photometric', 'H', 1,
-           {'miniswhite': 0, 'minisblack': 1, 'rgb': 2}[photometric])
-    addtag('samples_per_pixel', 'H', 1, samplesperpixel)
-    if planarconfig:
-        addtag('planar_configuration', 'H', 1, 1 if planarconfig=='contig'
-               else 2)
-        addtag('bits_per_sample', 'H', samplesperpixel,
-               (data.dtype.itemsize * 8, ) * samplesperpixel)
-    else:
-        addtag('bits_per_sample', 'H', 1, data.dtype.itemsize * 8)
-    if extrasamples:
+        """
+        fh = self._fh
+        pack = self._pack
+        fh.seek(0, 2)
+        pos = fh.tell()
+        if pos % 2:
+            fh.write(b'\0')  # IFD must begin on word boundary
+            pos += 1
+        next_ifd_offset = (pos + struct.calcsize(self._numtag_format) +
+                           len(tags) * self._tag_size)
+        value_offset = next_ifd_offset + self._offset_size
+        entries = [pack(self._numtag_format, len(tags))]
+        values = []
+        positions = {}
+        for code, dtype, count, value in tags:
+            if dtype == 'offset':
+                dtype = self._offset_format
+            valuebytes = pack(str(count)+dtype, *value)
+            entries.append(pack('HH', code, self.TYPES[dtype]))
+            entries.append(pack(self._offset_format, count))
+            if len(valuebytes) <= self._offset_size:
+                entries.append(pack(self._val_format, valuebytes))
+            else:
+                entries.append(pack(self._offset_format, value_offset))
+                positions[code] = value_offset
+                if len(valuebytes) % 2:
+                    valuebytes += b'\0'
+                values.append(valuebytes)
+                value_offset += len(valuebytes)
+        entries.append(pack(self._offset_format, 0))  # offset to next IFD
+        fh.write(b''.join(entries + values))
+        # link from header or previous IFD
+        fh.seek(self._ifd_offset)
+        fh.write(pack(self._offset_format, pos))
+        self._ifd_offset = next_ifd_offset
+        fh.seek(0, 2)
+        return positions
+
+    def _convert_to_bigtiff(self):
+        """Rewrite header and all IFDs in BigTIFF format.
+
+        The IFDs are appended to the file, image data stay in place.
+
+        """
+        self._set_format(True)
+        self._write_header()
+        for i, tags in enumerate(self._ifds):
+            positions = self._write_ifd(tags)
+            if i == 0 and self._shape:
+                self._shape[0] = positions[270]
+        self._ifds = []
+
+    def save(self, data, photometric=None, planarconfig=None,
+             resolution=None, description=None, extratags=(), compress=0,
+             predictor=None, rows_per_strip=None, maxworkers=None):
+        """Append image data to file.
+
+        Dimensions larger than 2 or 3 (depending on photometric mode and
+        planar configuration) are flattened and saved as separate pages.
+        Refer to the imsave function for documentation of the parameters.
+
+        """
+        assert(photometric in (None, 'minisblack', 'miniswhite', 'rgb'))
+        assert(planarconfig in (None, 'contig', 'planar'))
+        assert(0 <= compress <= 9)
+        assert(predictor in (None, 'horizontal', 'float'))
+
+        fh = self._fh
+        if not fh:
+            raise IOError("TIFF file is not open")
+        byteorder = self._byteorder
+
+        data = numpy.asarray(data)
+        data = numpy.asarray(data, dtype=byteorder+data.dtype.char, order='C')
+        data_shape = shape = data.shape
+        data = numpy.atleast_2d(data)
+
+        # unify shape of data
+        samplesperpixel = 1
+        extrasamples = 0
+        if photometric is None:
+            if data.ndim > 2 and (shape[-3] in (3, 4) or shape[-1] in (3, 4)):
+                photometric = 'rgb'
+            else:
+                photometric = 'minisblack'
         if photometric == 'rgb':
-            addtag('extra_samples', 'H', 1, 1)  # alpha channel
+            if len(shape) < 3:
+                raise ValueError("not a RGB(A) image")
+            if planarconfig is None:
+                planarconfig = 'planar' if shape[-3] in (3, 4) else 'contig'
+            if planarconfig == 'contig':
+                if shape[-1] not in (3, 4):
+                    raise ValueError("not a contiguous RGB(A) image")
+                data = data.reshape((-1, 1) + shape[-3:])
+                samplesperpixel = shape[-1]
+            else:
+                if shape[-3] not in (3, 4):
+                    raise ValueError("not a planar RGB(A) image")
+                data = data.reshape((-1, ) + shape[-3:] + (1, ))
+                samplesperpixel = shape[-3]
+            if samplesperpixel == 4:
+                extrasamples = 1
+        elif planarconfig and len(shape) > 2:
+            if planarconfig == 'contig':
+                data = data.reshape((-1, 1) + shape[-3:])
+                samplesperpixel = shape[-1]
+            else:
+                data = data.reshape((-1, ) + shape[-3:] + (1, ))
+                samplesperpixel = shape[-3]
+            extrasamples = samplesperpixel - 1
         else:
-            addtag('extra_samples', 'H', extrasamples, (0, ) * extrasamples)
-    if resolution:
-        addtag('x_resolution', '2I', 1, rational(resolution[0]))
-        addtag('y_resolution', '2I', 1, rational(resolution[1]))
-        addtag('resolution_unit', 'H', 1, 2)
-    addtag('rows_per_strip', 'I', 1, shape[-3])
-
-    # use one strip per plane
-    strip_byte_counts = (data[0, 0].size * data.dtype.itemsize, ) * shape[1]
-    addtag('strip_byte_counts', offset_format, shape[1], strip_byte_counts)
-    addtag('strip_offsets', offset_format, shape[1], (0, ) * shape[1])
-
-    # add extra tags from users
-    for t in extratags:
-        addtag(*t)
-
-    # the entries in an IFD must be sorted in ascending order by tag code
-    tags = sorted(tags, key=lambda x: x[0])
-
-    fh = open(filename, 'wb')
-    seek = fh.seek
-    tell = fh.tell
-
-    def write(arg, *args):
-        fh.write(pack(arg, *args) if args else arg)
-
-    write({'<': b'II', '>': b'MM'}[byteorder])
-    if bigtiff:
-        write('HHH', 43, 8, 0)
-    else:
-        write('H', 42)
-    ifd_offset = tell()
-    write(offset_format, 0)  # first IFD
-    for pageindex in range(shape[0]):
-        # update pointer at ifd_offset
-        pos = tell()
-        seek(ifd_offset)
-        write(offset_format, pos)
-        seek(pos)
-        # write ifdentries
-        write(numtag_format, len(tags))
-        tag_offset = tell()
-        write(b''.join(t[1] for t in tags))
-        ifd_offset = tell()
-        write(offset_format, 0)  # offset to next IFD
-        # write tag values and patch offsets in ifdentries, if necessary
-        for i, tag in enumerate(tags):
-            if tag[2]:
-                pos = tell()
-                seek(tag_offset + i*tag_size + offset_size + 4)
-                write(offset_format, pos)
-                seek(pos)
-                if tag[0] == 273:  # strip_offsets
-                    strip_offsets_offset = pos
-                write(tag[2])
-        # update strip_offsets
-        for i, tag in enumerate(tags):
-            if tag[0] == 273:
-                pos = tell()  # current is start of image data
-                if tag[2]:
-                    seek(strip_offsets_offset)
-                    strip_offset = pos
-                    for size in strip_byte_counts:
-                        write(offset_format, strip_offset)
-                        strip_offset += size
-                else:
-                    seek(tag_offset + i*tag_size + offset_size + 4)
-                    write(offset_format, pos)
-                seek(pos)
-                break
-        # write data
-        data[pageindex].tofile(fh)  # if this fails try update Python or numpy
-        fh.flush()
-        # remove tags that should be written only once
-        if pageindex == 0:
-            tags = [t for t in tags if not t[-1]]
-    fh.close()
+            planarconfig = None
+            # remove trailing 1s
+            while len(shape) > 2 and shape[-1] == 1:
+                shape = shape[:-1]
+            data = data.reshape((-1, 1) + shape[-2:] + (1, ))
+
+        shape = data.shape  # (pages, planes, height, width, contig samples)
+
+        if predictor and not compress:
+            raise ValueError("predictor requires compression")
+        if predictor == 'horizontal' and data.dtype.kind not in 'iu':
+            raise ValueError("horizontal predictor requires integer data")
+        if predictor == 'float' and data.dtype.kind != 'f':
+            raise ValueError("floating point predictor requires float data")
+        rowbytes = shape[-2] * shape[-1] * data.dtype.itemsize
+        if rows_per_strip is None:
+            if compress:
+                rows_per_strip = max(1, 2**16 // rowbytes)
+            else:
+                rows_per_strip = shape[-3]
+        rows_per_strip = max(1, min(int(rows_per_strip), shape[-3]))
+        strips = [(plane, row) for plane in range(shape[1])
+                  for row in range(0, shape[-3], rows_per_strip)]
+
+        bytestr = bytes if sys.version[0] == '2' else (
+            lambda x: bytes(x, 'utf-8') if isinstance(x, str) else x)
+        tags = []  # list of (code, dtype, count, value, writeonce)
+
+        def addtag(code, dtype, count, value, writeonce=False):
+            # normalize dtype, count and value and append to tags list
+            code = self.TAGS[code] if code in self.TAGS else int(code)
+            if dtype not in self.TYPES and dtype != 'offset':
+                raise ValueError("unknown dtype %s" % dtype)
+            if dtype == 's':
+                value = bytestr(value) + b'\0'
+                count = len(value)
+                value = (value, )
+            if len(dtype) > 1 and dtype != 'offset':
+                count *= int(dtype[:-1])
+                dtype = dtype[-1]
+            if not isinstance(value, (tuple, list)):
+                value = (value, )
+            tags.append((code, dtype, count, tuple(value), writeonce))
+
+        def rational(arg, max_denominator=1000000):
+            # return nominator and denominator from float or two integers
+            try:
+                f = Fraction.from_float(arg)
+            except TypeError:
+                f = Fraction(arg[0], arg[1])
+            f = f.limit_denominator(max_denominator)
+            return f.numerator, f.denominator
+
+        if self._pages == 0:
+            if self._software:
+                addtag('software', 's', 0, self._software, writeonce=True)
+            addtag('datetime', 's', 0,
+                   datetime.datetime.now().strftime("%Y:%m:%d %H:%M:%S"),
+                   writeonce=True)
+        if description:
+            addtag('image_description', 's', 0, description, writeonce=True)
+        elif shape != data_shape and self._pages == 0:
+            # reserve space for the number of saves, see close
+            addtag('image_description', 's', 0,
+                   "shape=(%s)" % (",".join('%i' % i for i in data_shape)) +
+                   '\0' * 24, writeonce=True)
+            self._shape = [None, 0, data_shape, shape[0], True]
+        elif self._shape and data_shape != self._shape[2]:
+            self._shape[4] = False
+        addtag('compression', 'H', 1, 8 if compress else 1)
+        if predictor:
+            addtag('predictor', 'H', 1,
+                   {'horizontal': 2, 'float': 3}[predictor])
+        addtag('orientation', 'H', 1, 1)
+        addtag('image_width', 'I', 1, shape[-2])
+        addtag('image_length', 'I', 1, shape[-3])
+        addtag('new_subfile_type', 'I', 1, 0 if shape[0] == 1 else 2)
+        addtag('sample_format', 'H', 1,
+               {'u': 1, 'i': 2, 'f': 3, 'c': 6}[data.dtype.kind])
+        addtag('photometric', 'H', 1,
+               {'miniswhite': 0, 'minisblack': 1, 'rgb': 2}[photometric])
+        addtag('samples_per_pixel', 'H', 1, samplesperpixel)
+        if planarconfig:
+            addtag('planar_configuration', 'H', 1, 1 if planarconfig=='contig'
+                   else 2)
+            addtag('bits_per_sample', 'H', samplesperpixel,
+                   (data.dtype.itemsize * 8, ) * samplesperpixel)
+        else:
+            addtag('bits_per_sample', 'H', 1, data.dtype.itemsize * 8)
+        if extrasamples:
+            if photometric == 'rgb':
+                addtag('extra_samples', 'H', 1, 1)  # alpha channel
+            else:
+                addtag('extra_samples', 'H', extrasamples,
+                       (0, ) * extrasamples)
+        if resolution:
+            addtag('x_resolution', '2I', 1, rational(resolution[0]))
+            addtag('y_resolution', '2I', 1, rational(resolution[1]))
+            addtag('resolution_unit', 'H', 1, 2)
+        addtag('rows_per_strip', 'I', 1, rows_per_strip)
+
+        # add extra tags from users
+        for t in extratags:
+            addtag(*t)
+
+        def encode(strip):
+            # return predictor encoded and compressed bytes of strip
+            plane, row = strip
+            strip = data[pageindex, plane, row:row+rows_per_strip]
+            if predictor == 'horizontal':
+                encoded = strip.copy()
+                encoded[:, 1:] -= strip[:, :-1]
+                strip = encoded
+            if predictor == 'float':
+                strip = encodefloatpred(strip, shape[-1])
+            else:
+                strip = strip.tostring()
+            if compress:
+                strip = zlib.compress(strip, compress)
+            return strip
+
+        strip_byte_counts = tuple(
+            min(rows_per_strip, shape[-3] - row) * rowbytes
+            for _, row in strips)
+        for pageindex in range(shape[0]):
+            if compress:
+                encoded = _thread_map(encode, strips, maxworkers)
+                strip_byte_counts = tuple(len(strip) for strip in encoded)
+            pagetags = [t[:4] for t in tags if pageindex == 0 or not t[4]]
+            if not self._bigtiff:
+                # data and IFD must end before 4 GB
+                size = sum(strip_byte_counts) + 16 * len(strips) + 2**16 + sum(
+                    struct.calcsize(str(t[2])+t[1]) for t in pagetags)
+                fh.seek(0, 2)
+                if fh.tell() + size >= 2**32:
+                    self._convert_to_bigtiff()
+            # write the IFD followed by its data, such that the data of
+            # uncompressed pages are equally spaced and can be memory mapped
+            # as one array
+            pagetags.append((279, 'offset', len(strips), strip_byte_counts))
+            pagetags.append((273, 'offset', len(strips), (0, ) * len(strips)))
+            fh.seek(0, 2)
+            pos = fh.tell() + fh.tell() % 2  # IFD begins on word boundary
+            strip_offsets = [pos + self._ifd_size(pagetags)]
+            for size in strip_byte_counts[:-1]:
+                strip_offsets.append(strip_offsets[-1] + size)
+            pagetags[-1] = (273, 'offset', len(strips), tuple(strip_offsets))
+            # the entries in an IFD must be sorted in ascending order by code
+            pagetags.sort(key=lambda x: x[0])
+            positions = self._write_ifd(pagetags)
+            if self._shape and self._pages == 0:
+                self._shape[:2] = positions[270], dict(
+                    (t[0], t[2]) for t in pagetags)[270]
+            if not self._bigtiff:
+                self._ifds.append(pagetags)
+            # write data
+            if compress:
+                for strip in encoded:
+                    fh.write(strip)
+                del encoded
+            else:
+                data[pageindex].tofile(fh)  # if fails try update numpy
+            fh.flush()
+            self._pages += 1
+
+    def close(self):
+        """Close the file.
+
+        If pages were appended by several calls of save, the shape in the
+        description of the first page is updated with the number of calls,
+        or removed if the calls saved data of different shapes.
+
+        """
+        if self._fh and self._shape:
+            position, size, shape, pages, alike = self._shape
+            description = b''
+            if alike and self._pages % pages == 0:
+                shape = (self._pages // pages, ) + shape
+                description = ("shape=(%s)" % (
+                    ",".join('%i' % i for i in shape))).encode('ascii')
+            if self._pages != pages and len(description) < size:
+                self._fh.seek(position)
+                self._fh.write(description.ljust(size, b'\0'))
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 def imread(files, *args, **kwargs):
@@ -554,7 +773,8 @@ class TiffFile(object):
     ...     tif.close()
 
     """
-    def __init__(self, arg, name=None, multifile=False):
+    def __init__(self, arg, name=None, multifile=False, lazy=False,
+                 uniform=False, use_mmap=False):
         """Initialize instance from file.
 
         Parameters
@@ -566,6 +786,21 @@ class TiffFile(object):
             Human readable label of open file.
         multifile : bool
             If True, series may include pages from multiple files.
+        lazy : bool
+            If True, only the offsets of all image file directories are
+            read on open and each page is parsed on first access.
+        uniform : bool
+            If True, all pages are assumed to have the same shape and
+            properties as the first page, such that the series can be
+            determined without parsing the other pages. Implies lazy.
+            All pages but the first are represented by TiffFrame instances,
+            which take a small fraction of the memory of a TiffPage.
+        use_mmap : bool
+            If True, image file directories and tag values are parsed from
+            a read-only memory map of the file instead of issuing a seek and
+            a small read per tag, which is much faster on network file
+            systems. Falls back to regular reads if the file cannot be
+            memory mapped.
 
         """
         if isinstance(arg, basestring):
@@ -578,21 +813,35 @@ class TiffFile(object):
         self._fh.seek(0, 2)
         self._fsize = self._fh.tell()
         self._fh.seek(0)
+        self._map = None
+        if use_mmap and self._fsize:
+            try:
+                self._map = mmap.mmap(self._fh.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            except Exception:
+                pass
         self.fname = os.path.basename(filename)
         self.fpath = os.path.dirname(filename)
         self._tiffs = {self.fname: self}  # cache of TiffFiles
         self.offset_size = None
         self.pages = []
         self._multifile = bool(multifile)
+        self._uniform = bool(uniform)
+        self._lazy = self._uniform or bool(lazy)
         try:
             self._fromfile()
         except Exception:
+            if self._map is not None:
+                self._map.close()
             self._fh.close()
             raise
 
     def close(self):
         """Close open file handle(s)."""
         for tif in self._tiffs.values():
+            if tif._map is not None:
+                tif._map.close()
+                tif._map = None
             if tif._fh:
                 tif._fh.close()
                 tif._fh = None
@@ -616,12 +865,15 @@ class TiffFile(object):
         else:
             raise ValueError("not a TIFF file")
         self.pages = []
-        while True:
-            try:
-                page = TiffPage(self)
-                self.pages.append(page)
-            except StopIteration:
-                break
+        if self._lazy:
+            self.pages = TiffPages(self, self._ifd_pointers())
+        else:
+            while True:
+                try:
+                    page = TiffPage(self)
+                    self.pages.append(page)
+                except StopIteration:
+                    break
         if not self.pages:
             raise ValueError("empty TIFF file")
 
@@ -629,6 +881,54 @@ class TiffFile(object):
             # MicroManager files contain metadata not stored in TIFF tags.
             self.micromanager_metadata = read_micromanager_metadata(self._fh)
 
+    def _ifd_pointers(self):
+        """Return file positions of the offsets of all IFDs.
+
+        Only the number of tags of each IFD is read to locate the offset of
+        the next IFD. File cursor must be at the offset of the first IFD.
+
+        """
+        fh = self._fh
+        buf = self._map
+        byteorder = self.byteorder
+        offset_size = self.offset_size
+        offset_fmt = byteorder + {4: 'I', 8: 'Q'}[offset_size]
+        numtags_fmt, numtags_size, tag_size = {
+            4: ('H', 2, 12), 8: ('Q', 8, 20)}[offset_size]
+        pointers = []
+        pos = fh.tell()
+        while True:
+            try:
+                if buf is None:
+                    fh.seek(pos)
+                    offset = struct.unpack(offset_fmt,
+                                           fh.read(offset_size))[0]
+                else:
+                    offset = struct.unpack_from(offset_fmt, buf, pos)[0]
+            except struct.error:
+                warnings.warn("corrupted page list")
+                break
+            if not offset:
+                break
+            try:
+                if buf is None:
+                    fh.seek(offset)
+                    numtags = struct.unpack(byteorder + numtags_fmt,
+                                            fh.read(numtags_size))[0]
+                else:
+                    numtags = struct.unpack_from(byteorder + numtags_fmt,
+                                                 buf, offset)[0]
+            except Exception:
+                warnings.warn("corrupted page list")
+                break
+            pointers.append(pos)
+            pos = offset + numtags_size + numtags * tag_size
+        return pointers
+
+    def _representative_pages(self):
+        """Return pages whose properties apply to all pages in file."""
+        return self.pages[:1] if self._uniform else self.pages
+
     @lazyattr
     def series(self):
         """Return series of TiffPage with compatible shape and properties."""
@@ -700,6 +1000,17 @@ class TiffFile(object):
                              axes='Q' * len(shape),
                              dtype=numpy.dtype(self.pages[0].dtype))]
 
+        if not series and self._uniform:
+            page = self.pages[0]
+            if len(self.pages) > 1:
+                series = [Record(pages=self.pages, axes='I' + page.axes,
+                                 dtype=numpy.dtype(page.dtype),
+                                 shape=(len(self.pages), ) + page.shape)]
+            else:
+                series = [Record(pages=self.pages, axes=page.axes,
+                                 dtype=numpy.dtype(page.dtype),
+                                 shape=page.shape)]
+
         if not series:
             shapes = []
             pages = {}
@@ -722,7 +1033,7 @@ class TiffFile(object):
                       for s in shapes]
         return series
 
-    def asarray(self, key=None, series=None, memmap=False):
+    def asarray(self, key=None, series=None, memmap=False, maxworkers=1):
         """Return image data of multiple TIFF pages as numpy array.
 
         By default the first image series is returned.
@@ -735,6 +1046,11 @@ class TiffFile(object):
             Defines which series of pages to return as array.
         memmap : bool
             If True use numpy.memmap to read arrays from file if possible.
+            Uncompressed pages stored equally spaced in the file, e.g. by
+            imsave, are returned as a single memory-mapped array without
+            reading or copying any data.
+        maxworkers : int
+            Maximum number of threads decoding the strips or tiles of a page.
 
         """
         if key is None and series is None:
@@ -756,20 +1072,24 @@ class TiffFile(object):
             raise TypeError("key must be an int, slice, or sequence")
 
         if len(pages) == 1:
-            return pages[0].asarray(memmap=memmap)
-        elif self.is_nih:
+            return pages[0].asarray(memmap=memmap, maxworkers=maxworkers)
+
+        result = self._memmap_pages(pages) if memmap else None
+        if result is None and self.is_nih:
             result = numpy.vstack(
-                p.asarray(colormapped=False, squeeze=False, memmap=memmap)
+                p.asarray(colormapped=False, squeeze=False, memmap=memmap,
+                          maxworkers=maxworkers)
                 for p in pages)
             if pages[0].is_palette:
                 result = numpy.take(pages[0].color_map, result, axis=1)
                 result = numpy.swapaxes(result, 0, 1)
-        else:
+        elif result is None:
             if self.is_ome and any(p is None for p in pages):
                 firstpage = next(p for p in pages if p)
                 nopage = numpy.zeros_like(firstpage.asarray(memmap=memmap))
-            result = numpy.vstack((p.asarray(memmap=memmap) if p else nopage)
-                                  for p in pages)
+            result = numpy.vstack(
+                (p.asarray(memmap=memmap, maxworkers=maxworkers)
+                 if p else nopage) for p in pages)
         if key is None:
             try:
                 result.shape = self.series[series].shape
@@ -781,6 +1101,63 @@ class TiffFile(object):
             result.shape = (-1,) + pages[0].shape
         return result
 
+    def _memmap_pages(self, pages):
+        """Return data of pages as one memory-mapped array.
+
+        The pages must have the same shape and uncompressed data type and
+        their data must be stored contiguously and equally spaced in this
+        file. The result is a numpy.memmap if the data of the pages follow
+        each other directly, else a strided view of one. Return None if the
+        pages do not qualify.
+
+        """
+        first = pages[0]
+        if (first is None or not first.shape or first.dtype is None or
+                first.is_tiled or first.is_stk or first.is_palette or
+                first.compression or first.predictor or
+                'extra_samples' in first.tags or
+                first.bits_per_sample not in (8, 16, 32, 64) or
+                numpy.prod(first._shape) != numpy.prod(first.shape)):
+            return None
+        dtype = numpy.dtype(self.byteorder + first._dtype)
+        nbytes = int(numpy.prod(first.shape)) * dtype.itemsize
+
+        data_offsets = []
+        for page in pages:
+            if page is not first and (
+                    page is None or page.parent is not self or
+                    page.shape != first.shape or
+                    page._dtype != first._dtype or page.is_tiled or
+                    page.compression or page.predictor):
+                return None
+            offsets = page.strip_offsets
+            byte_counts = page.strip_byte_counts
+            try:
+                offsets[0]
+            except TypeError:
+                offsets = (offsets, )
+                byte_counts = (byte_counts, )
+            if sum(byte_counts) < nbytes or any(
+                    offsets[i] + byte_counts[i] != offsets[i+1]
+                    for i in range(len(offsets)-1)):
+                return None
+            data_offsets.append(int(offsets[0]))
+
+        start = data_offsets[0]
+        stride = data_offsets[1] - start
+        if stride < nbytes or any(offset != start + i * stride for i, offset
+                                  in enumerate(data_offsets)):
+            return None
+        shape = (len(pages), ) + first.shape
+        if stride == nbytes:
+            return numpy.memmap(self._fh, dtype, 'r', start, shape)
+        # map the whole range and view the data of the first page strided
+        data = numpy.memmap(self._fh, 'u1', 'r', start,
+                            (stride * (len(pages) - 1) + nbytes, ))
+        data = data[:nbytes].view(dtype).reshape(first.shape)
+        return numpy.lib.stride_tricks.as_strided(
+            data, shape, (stride, ) + data.strides)
+
     def _omeseries(self):
         """Return image series in OME-TIFF file(s)."""
         root = ElementTree.XML(self.pages[0].tags['image_description'].value)
@@ -923,23 +1300,23 @@ class TiffFile(object):
 
     @lazyattr
     def is_rgb(self):
-        return all(p.is_rgb for p in self.pages)
+        return all(p.is_rgb for p in self._representative_pages())
 
     @lazyattr
     def is_palette(self):
-        return all(p.is_palette for p in self.pages)
+        return all(p.is_palette for p in self._representative_pages())
 
     @lazyattr
     def is_mdgel(self):
-        return any(p.is_mdgel for p in self.pages)
+        return any(p.is_mdgel for p in self._representative_pages())
 
     @lazyattr
     def is_mediacy(self):
-        return any(p.is_mediacy for p in self.pages)
+        return any(p.is_mediacy for p in self._representative_pages())
 
     @lazyattr
     def is_stk(self):
-        return all(p.is_stk for p in self.pages)
+        return all(p.is_stk for p in self._representative_pages())
 
     @lazyattr
     def is_lsm(self):
@@ -999,10 +1376,10 @@ class TiffPage(object):
     All attributes are read-only.
 
     """
-    def __init__(self, parent):
+    def __init__(self, parent, index=None):
         """Initialize instance from file."""
         self.parent = parent
-        self.index = len(parent.pages)
+        self.index = len(parent.pages) if index is None else index
         self.shape = self._shape = ()
         self.dtype = self._dtype = None
         self.axes = ""
@@ -1021,28 +1398,45 @@ class TiffPage(object):
 
         """
         fh = self.parent._fh
+        buf = self.parent._map
         byteorder = self.parent.byteorder
         offset_size = self.parent.offset_size
 
         fmt = {4: 'I', 8: 'Q'}[offset_size]
-        offset = struct.unpack(byteorder + fmt, fh.read(offset_size))[0]
+        if buf is None:
+            offset = struct.unpack(byteorder + fmt, fh.read(offset_size))[0]
+        else:
+            # parse the IFD from the memory map, only move the file cursor
+            try:
+                offset = struct.unpack_from(byteorder + fmt, buf,
+                                            fh.tell())[0]
+            except struct.error:
+                offset = 0
         if not offset:
             raise StopIteration()
 
         # read standard tags
         tags = self.tags
-        fh.seek(offset)
         fmt, size = {4: ('H', 2), 8: ('Q', 8)}[offset_size]
         try:
-            numtags = struct.unpack(byteorder + fmt, fh.read(size))[0]
+            if buf is None:
+                fh.seek(offset)
+                numtags = struct.unpack(byteorder + fmt, fh.read(size))[0]
+            else:
+                numtags = struct.unpack_from(byteorder + fmt, buf, offset)[0]
         except Exception:
             warnings.warn("corrupted page list")
             raise StopIteration()
 
+        tagsize = {4: 12, 8: 20}[offset_size]
         tagcode = 0
-        for _ in range(numtags):
+        for i in range(numtags):
             try:
-                tag = TiffTag(self.parent)
+                if buf is None:
+                    tag = TiffTag(self.parent)
+                else:
+                    tag = TiffTag(self.parent,
+                                  offset=offset + size + i * tagsize)
             except TiffTag.Error as e:
                 warnings.warn(str(e))
             finally:
@@ -1059,6 +1453,8 @@ class TiffPage(object):
                         if not name in tags:
                             tags[name] = tag
                             break
+        if buf is not None:
+            fh.seek(offset + size + numtags * tagsize)
 
         # read LSM info subrecords
         if self.is_lsm:
@@ -1086,8 +1482,12 @@ class TiffPage(object):
         tags = self.tags
         for code, (name, default, dtype, count, validate) in TIFF_TAGS.items():
             if not (name in tags or default is None):
-                tags[name] = TiffTag(code, dtype=dtype, count=count,
-                                     value=default, name=name)
+                # tags with default values are shared among all pages
+                if code not in _DEFAULT_TAGS:
+                    _DEFAULT_TAGS[code] = TiffTag(code, dtype=dtype,
+                                                  count=count, value=default,
+                                                  name=name)
+                tags[name] = _DEFAULT_TAGS[code]
             if name in tags and validate:
                 try:
                     if tags[name].count == 1:
@@ -1245,9 +1645,13 @@ class TiffPage(object):
                 self.bits_per_sample // 8)
 
     def asarray(self, squeeze=True, colormapped=True, rgbonly=True,
-                memmap=False):
+                memmap=False, y=0, height=None, y_step=1, maxworkers=1,
+                dtype=None):
         """Read image data from file and return as numpy array.
 
+        Only the strips, tiles or byte ranges of contiguous data covering
+        the selected rows are read from file.
+
         Raise ValueError if format is unsupported.
         If any argument is False, the shape of the returned array might be
         different from the page shape.
@@ -1263,6 +1667,20 @@ class TiffPage(object):
             If True return RGB(A) image without additional extra samples.
         memmap : bool
             If True use numpy.memmap to read array if possible.
+        y : int
+            Index of the first row to read.
+        height : int
+            Number of rows to read. By default all rows from y on are read.
+        y_step : int
+            Return only every y_step-th row.
+        maxworkers : int
+            Maximum number of threads decoding compressed strips or tiles.
+            If None, one thread per CPU is used. Only worthwhile for
+            decompressors that release the GIL, e.g. zlib.
+        dtype : numpy.dtype
+            If not None, the data type of the returned array. Strips, tiles
+            and blocks of rows are converted while they are read into a
+            single result array instead of converting a full copy later.
 
         """
         fh = self.parent._fh
@@ -1280,6 +1698,7 @@ class TiffPage(object):
         if tag.count != 1 and any((i-tag.value[0] for i in tag.value)):
             raise ValueError("sample formats don't match %s" % str(tag.value))
 
+        outtype = dtype
         dtype = self._dtype
         shape = self._shape
 
@@ -1288,10 +1707,24 @@ class TiffPage(object):
 
         image_width = self.image_width
         image_length = self.image_length
+        if not 0 <= y < image_length:
+            raise ValueError("first row %i out of range" % y)
+        if (height is not None and height < 1) or y_step < 1:
+            raise ValueError("invalid row height or step")
+        y_end = image_length if height is None else min(y + height,
+                                                        image_length)
+        shape = shape[:-3] + (y_end - y, ) + shape[-2:]
         typecode = self.parent.byteorder + dtype
         bits_per_sample = self.bits_per_sample
         byteorder_is_native = ({'big': '>', 'little': '<'}[sys.byteorder] ==
                                self.parent.byteorder)
+        # data type of the decoded array, predictor and color map need the
+        # original data type and are applied before converting to outtype
+        if outtype is None or (colormapped and self.is_palette) or (
+                self.predictor == 'horizontal' and not self.is_tiled):
+            readtype = numpy.dtype('=' + dtype)
+        else:
+            readtype = numpy.dtype(outtype)
 
         if self.is_tiled:
             if 'tile_offsets' in self.tags:
@@ -1304,7 +1737,9 @@ class TiffPage(object):
             tile_length = self.tile_length
             tw = (image_width + tile_width - 1) // tile_width
             tl = (image_length + tile_length - 1) // tile_length
-            shape = shape[:-3] + (tl*tile_length, tw*tile_width, shape[-1])
+            # rows of the first and after the last tile covering y:y_end
+            ty = (y // tile_length) * tile_length
+            ty_end = -(-y_end // tile_length) * tile_length
             tile_shape = (tile_length, tile_width, shape[-1])
             runlen = tile_width
         else:
@@ -1321,6 +1756,7 @@ class TiffPage(object):
             raise ValueError("corrupted page")
 
         if (not self.is_tiled and (self.is_stk or (not self.compression
+            and self.predictor != 'float'
             and bits_per_sample in (8, 16, 32, 64)
             and all(offsets[i] == offsets[i+1] - byte_counts[i]
                     for i in range(len(offsets)-1))))):
@@ -1329,16 +1765,39 @@ class TiffPage(object):
                                 ('extra_samples' in self.tags) or
                                 (colormapped and self.is_palette) or
                                 (not byteorder_is_native))):
-                fh.seek(offsets[0])
-                result = numpy_fromfile(fh, typecode, numpy.prod(shape))
-                result = result.astype('=' + dtype)
+                # read blocks of rows and convert them into the result
+                rowsize = shape[-2] * shape[-1]
+                rowbytes = rowsize * numpy.dtype(typecode).itemsize
+                blockrows = max(1, 2**22 // rowbytes)
+                result = numpy.empty(shape, readtype)
+                result = result.reshape(-1, y_end - y, rowsize)
+                for plane in range(len(result)):
+                    for start in range(y, y_end, blockrows):
+                        stop = min(start + blockrows, y_end)
+                        fh.seek(offsets[0] +
+                                (plane * image_length + start) * rowbytes)
+                        block = numpy_fromfile(fh, typecode,
+                                               (stop - start) * rowsize)
+                        result[plane, start-y:stop-y] = block.reshape(
+                            stop - start, rowsize)
             else:
                 # memory map
-                result = numpy.memmap(fh, typecode, 'r', offsets[0], shape)
+                result = numpy.memmap(fh, typecode, 'r', offsets[0],
+                                      self._shape)
+                result = result[..., y:y_end, :, :]
         else:
+            samples = 1
             if self.planar_configuration == 'contig':
-                runlen *= self.samples_per_pixel
-            if bits_per_sample in (8, 16, 32, 64, 128):
+                samples = self.samples_per_pixel
+                runlen *= samples
+            if self.predictor == 'float':
+                if dtype not in 'efd':
+                    raise ValueError("floating point predictor with %s data"
+                                     % dtype)
+
+                def unpack(x):
+                    return decodefloatpred(x, dtype, runlen, samples)
+            elif bits_per_sample in (8, 16, 32, 64, 128):
                 if (bits_per_sample * runlen) % 8:
                     raise ValueError("data and sample size mismatch")
 
@@ -1352,44 +1811,68 @@ class TiffPage(object):
                     return unpackints(x, typecode, bits_per_sample, runlen)
             decompress = TIFF_DECOMPESSORS[self.compression]
             if self.is_tiled:
-                result = numpy.empty(shape, dtype)
-                tw, tl, pl = 0, 0, 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    tile = unpack(decompress(fh.read(bytecount)))
+                result = numpy.empty(shape[:-3] + (ty_end - ty,
+                                     tw*tile_width, shape[-1]), readtype)
+                segments = []
+                for index in range(len(offsets)):
+                    pl, top = divmod(index, tw * tl)
+                    top, left = divmod(top, tw)
+                    top, left = top * tile_length, left * tile_width
+                    if top + tile_length <= y or top >= y_end:
+                        continue
+                    segments.append((index, (pl, top, left)))
+
+                def decode(args):
+                    data, (pl, top, left) = args
+                    tile = unpack(decompress(data))
                     tile.shape = tile_shape
                     if self.predictor == 'horizontal':
                         numpy.cumsum(tile, axis=-2, dtype=dtype, out=tile)
-                    result[0, pl, tl:tl+tile_length,
-                           tw:tw+tile_width, :] = tile
-                    del tile
-                    tw += tile_width
-                    if tw >= shape[-2]:
-                        tw, tl = 0, tl + tile_length
-                        if tl >= shape[-3]:
-                            tl, pl = 0, pl + 1
-                result = result[..., :image_length, :image_width, :]
+                    result[0, pl, top-ty:top-ty+tile_length,
+                           left:left+tile_width, :] = tile
             else:
-                strip_size = (self.rows_per_strip * self.image_width *
-                              self.samples_per_pixel)
-                result = numpy.empty(shape, dtype).reshape(-1)
-                index = 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    strip = unpack(decompress(fh.read(bytecount)))
-                    size = min(result.size, strip.size, strip_size,
-                               result.size - index)
-                    result[index:index+size] = strip[:size]
-                    del strip
-                    index += size
+                rows_per_strip = min(self.rows_per_strip, image_length)
+                rowsize = shape[-2] * shape[-1]
+                result = numpy.empty(shape, readtype)
+                result = result.reshape(-1, y_end - y, rowsize)
+                segments = []
+                for index in range(len(offsets)):
+                    plane, top = divmod(index, self.strips_per_image)
+                    top *= rows_per_strip
+                    start = max(top, y)
+                    stop = min(top + rows_per_strip, y_end)
+                    if start >= stop or plane >= len(result):
+                        continue
+                    segments.append((index, (plane, top, start, stop)))
+
+                def decode(args):
+                    data, (plane, top, start, stop) = args
+                    strip = unpack(decompress(data))
+                    size = min(strip.size // rowsize, stop - top)
+                    strip = strip[:size * rowsize].reshape(size, rowsize)
+                    strip = strip[start-top:]
+                    result[plane, start-y:start-y+len(strip)] = strip
+
+            # read all selected strips or tiles at once, then decode them
+            # concurrently into the preallocated result
+            data = _read_segments(fh, [offsets[i] for i, _ in segments],
+                                  [byte_counts[i] for i, _ in segments])
+            _thread_map(decode, zip(data, [pos for _, pos in segments]),
+                        maxworkers)
+            del data
+            if self.is_tiled:
+                result = result[..., y-ty:y_end-ty, :image_width, :]
 
-        result.shape = self._shape
+        result.shape = shape
 
         if self.predictor == 'horizontal' and not self.is_tiled:
             # work around bug in LSM510 software
             if not (self.parent.is_lsm and not self.compression):
                 numpy.cumsum(result, axis=-2, dtype=dtype, out=result)
 
+        if y_step > 1:
+            result = result[..., ::y_step, :, :]
+
         if colormapped and self.is_palette:
             if self.color_map.shape[1] >= 2**bits_per_sample:
                 # FluoView and LSM might fail here
@@ -1414,11 +1897,16 @@ class TiffPage(object):
                     result = result[:, :3]
 
         if squeeze:
+            shape = list(self.shape)
+            shape[self.axes.index('Y')] = len(range(y, y_end, y_step))
             try:
-                result.shape = self.shape
+                result.shape = shape
             except ValueError:
                 warnings.warn("failed to reshape from %s to %s" % (
-                    str(result.shape), str(self.shape)))
+                    str(result.shape), str(tuple(shape))))
+
+        if outtype is not None and result.dtype != outtype:
+            result = numpy.asarray(result, outtype)
 
         return result
 
@@ -1524,6 +2012,146 @@ class TiffPage(object):
         return 'micromanager_metadata' in self.tags
 
 
+class TiffPages(object):
+    """Sequence of TIFF pages, which are parsed on first access.
+
+    Used by TiffFile instances opened in lazy mode.
+
+    """
+    def __init__(self, parent, pointers):
+        """Initialize instance from file positions of IFD offsets."""
+        self.parent = parent
+        self._pointers = pointers
+        self._pages = [None] * len(pointers)
+
+    def __len__(self):
+        """Return number of pages."""
+        return len(self._pages)
+
+    def __getitem__(self, key):
+        """Return page or list of pages, parse them if necessary."""
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self._pages)))]
+        page = self._pages[key]
+        if page is None:
+            index = key + len(self._pages) if key < 0 else key
+            keyframe = self[0] if self.parent._uniform and index else None
+            self.parent._fh.seek(self._pointers[index])
+            if keyframe is None:
+                page = TiffPage(self.parent, index=index)
+            else:
+                page = TiffFrame(keyframe, index)
+            self._pages[index] = page
+        return page
+
+    def __iter__(self):
+        """Return iterator over pages."""
+        for i in range(len(self._pages)):
+            yield self[i]
+
+
+class TiffFrame(object):
+    """Lightweight TIFF page sharing all properties with a key page.
+
+    Only the offsets and byte counts of the strips or tiles are read from
+    the image file directory and stored in numpy arrays. All other tags and
+    attributes are those of the key page. Used for all but the first page of
+    TiffFile instances opened in uniform mode.
+
+    Attributes
+    ----------
+    keyframe : TiffPage
+        Page whose properties apply to this frame.
+    index : int
+        Index of page in file.
+
+    """
+    __slots__ = ('keyframe', 'index', '_offsets', '_byte_counts')
+
+    DATA_TAGS = {273: 'offsets', 279: 'byte_counts',
+                 324: 'offsets', 325: 'byte_counts'}
+
+    def __init__(self, keyframe, index):
+        """Initialize instance from file.
+
+        File cursor must be at storage position of IFD offset.
+
+        """
+        self.keyframe = keyframe
+        self.index = index
+        self._offsets = self._byte_counts = None
+
+        parent = keyframe.parent
+        fh = parent._fh
+        buf = parent._map
+        byteorder = parent.byteorder
+        offset_size = parent.offset_size
+        offset_fmt = byteorder + {4: 'I', 8: 'Q'}[offset_size]
+        numtags_fmt, numtags_size, tag_fmt, tag_size = {
+            4: ('H', 2, 'HHI4s', 12), 8: ('Q', 8, 'HHQ8s', 20)}[offset_size]
+
+        def read(offset, size):
+            if buf is not None:
+                return buf[offset:offset+size]
+            fh.seek(offset)
+            return fh.read(size)
+
+        pos = fh.tell()
+        offset = struct.unpack(offset_fmt, read(pos, offset_size))[0]
+        numtags = struct.unpack(byteorder + numtags_fmt,
+                                read(offset, numtags_size))[0]
+        entries = read(offset + numtags_size, numtags * tag_size)
+        for i in range(numtags):
+            code, dtype, count, value = struct.unpack_from(
+                byteorder + tag_fmt, entries, i * tag_size)
+            if code not in TiffFrame.DATA_TAGS:
+                continue
+            dtype = byteorder + TIFF_DATA_TYPES[dtype][-1]
+            size = count * numpy.dtype(dtype).itemsize
+            if size > offset_size:
+                value = read(struct.unpack(offset_fmt, value)[0], size)
+            data = numpy.fromstring(value[:size], dtype).astype(numpy.int64)
+            setattr(self, '_' + TiffFrame.DATA_TAGS[code], data)
+        if self._offsets is None or self._byte_counts is None:
+            raise ValueError("page %i has no data offsets" % index)
+        fh.seek(offset + numtags_size + numtags * tag_size)
+
+    @property
+    def parent(self):
+        return self.keyframe.parent
+
+    @property
+    def tags(self):
+        """Tags of the key page with the data offsets of this frame."""
+        tags = TiffTags(self.keyframe.tags)
+        if 'tile_offsets' in tags:
+            data_tags = ((324, 'tile_offsets', self._offsets),
+                         (325, 'tile_byte_counts', self._byte_counts))
+        else:
+            data_tags = ((273, 'strip_offsets', self._offsets),
+                         (279, 'strip_byte_counts', self._byte_counts))
+        for code, name, value in data_tags:
+            dtype = {'H': 3, 'I': 4, 'Q': 16}[tags[name].dtype[-1]]
+            value = tuple(int(v) for v in value)
+            tags[name] = TiffTag(code, dtype=dtype, count=len(value),
+                                 value=value[0] if len(value) == 1 else value,
+                                 name=name)
+        return tags
+
+    def __getattr__(self, name):
+        """Return data offsets or attribute of key page."""
+        if name in ('strip_offsets', 'tile_offsets'):
+            value = self._offsets
+        elif name in ('strip_byte_counts', 'tile_byte_counts'):
+            value = self._byte_counts
+        else:
+            return getattr(self.keyframe, name)
+        return int(value[0]) if len(value) == 1 else value
+
+    asarray = TiffPage.__dict__['asarray']
+    __str__ = TiffPage.__dict__['__str__']
+
+
 class TiffTag(object):
     """A TIFF tag structure.
 
@@ -1567,17 +2195,27 @@ class TiffTag(object):
         self.count = int(count)
         self.value = value
 
-    def _fromfile(self, parent):
-        """Read tag structure from open file. Advance file cursor."""
+    def _fromfile(self, parent, offset=None):
+        """Read tag structure from open file. Advance file cursor.
+
+        If offset is given, the tag at this file position is parsed from the
+        memory map of the parent and the file cursor is not used.
+
+        """
         fh = parent._fh
+        buf = None if offset is None else parent._map
         byteorder = parent.byteorder
-        self._offset = fh.tell()
+        self._offset = fh.tell() if buf is None else offset
         self.value_offset = self._offset + parent.offset_size + 4
 
         fmt, size = {4: ('HHI4s', 12), 8: ('HHQ8s', 20)}[parent.offset_size]
-        data = fh.read(size)
-        code, dtype = struct.unpack(byteorder + fmt[:2], data[:4])
-        count, value = struct.unpack(byteorder + fmt[2:], data[4:])
+        if buf is None:
+            data = fh.read(size)
+            code, dtype = struct.unpack(byteorder + fmt[:2], data[:4])
+            count, value = struct.unpack(byteorder + fmt[2:], data[4:])
+        else:
+            code, dtype, count, value = struct.unpack_from(byteorder + fmt,
+                                                           buf, offset)
         self._value = value
 
         if code in TIFF_TAGS:
@@ -1595,26 +2233,32 @@ class TiffTag(object):
         fmt = '%s%i%s' % (byteorder, count*int(dtype[0]), dtype[1])
         size = struct.calcsize(fmt)
         if size > parent.offset_size or code in CUSTOM_TAGS:
-            pos = fh.tell()
             tof = {4: 'I', 8: 'Q'}[parent.offset_size]
             self.value_offset = offset = struct.unpack(byteorder+tof, value)[0]
             if offset < 0 or offset > parent._fsize:
                 raise TiffTag.Error("corrupt file - invalid tag value offset")
             elif offset < 4:
                 raise TiffTag.Error("corrupt value offset for tag %i" % code)
-            fh.seek(offset)
-            if code in CUSTOM_TAGS:
-                readfunc = CUSTOM_TAGS[code][1]
-                value = readfunc(fh, byteorder, dtype, count)
-                fh.seek(0, 2)  # bug in numpy/Python 3.x ?
-                if isinstance(value, dict):  # numpy.core.records.record
-                    value = Record(value)
+            if buf is None or code in CUSTOM_TAGS:
+                pos = fh.tell()
+                fh.seek(offset)
+                if code in CUSTOM_TAGS:
+                    readfunc = CUSTOM_TAGS[code][1]
+                    value = readfunc(fh, byteorder, dtype, count)
+                    fh.seek(0, 2)  # bug in numpy/Python 3.x ?
+                    if isinstance(value, dict):  # numpy.core.records.record
+                        value = Record(value)
+                elif code in TIFF_TAGS or dtype[-1] == 's':
+                    value = struct.unpack(fmt, fh.read(size))
+                else:
+                    value = read_numpy(fh, byteorder, dtype, count)
+                    fh.seek(0, 2)  # bug in numpy/Python 3.x ?
+                fh.seek(pos)
             elif code in TIFF_TAGS or dtype[-1] == 's':
-                value = struct.unpack(fmt, fh.read(size))
+                value = struct.unpack(fmt, buf[offset:offset+size])
             else:
-                value = read_numpy(fh, byteorder, dtype, count)
-                fh.seek(0, 2)  # bug in numpy/Python 3.x ?
-            fh.seek(pos)
+                value = numpy.fromstring(buf[offset:offset+size],
+                                         byteorder+dtype[-1])
         else:
             value = struct.unpack(fmt, value[:size])
 
@@ -1636,6 +2280,166 @@ class TiffTag(object):
         return ' '.join(str(getattr(self, s)) for s in self.__slots__)
 
 
+class TiffLayout(object):
+    """Layout of a single page, uncompressed, contiguous TIFF file.
+
+    Files sharing the layout of a template file, e.g. all projections of
+    one acquisition, are read with one seek and readinto at the data offset
+    found in their IFD. Only the header and IFD entries are read to verify
+    the layout; no TiffFile, TiffPage or TiffTag instances are created.
+
+    Attributes
+    ----------
+    shape : tuple
+        Shape of the image, as returned by TiffFile.asarray.
+    dtype : numpy.dtype
+        Data type of the image in the file.
+    offset : int
+        Position of the image data in the template file.
+
+    Examples
+    --------
+    >>> imsave('temp.tif', numpy.ones((301, 219), 'uint16'))
+    >>> layout = TiffLayout('temp.tif')
+    >>> layout.read('temp.tif').shape
+    (301, 219)
+
+    """
+    # tags defining the layout; their IFD entries must match the template's
+    LAYOUT_TAGS = (256, 257, 258, 259, 262, 277, 284, 317, 338, 339)
+
+    def __init__(self, filename):
+        """Initialize layout from template file.
+
+        Raise ValueError if the file does not have a fixed layout.
+
+        """
+        with TiffFile(filename, lazy=True) as tif:
+            if len(tif.pages) != 1:
+                raise ValueError("not a single page file")
+            page = tif.pages[0]
+            if (page.dtype is None or page.compression or page.is_tiled
+                    or page.predictor or page.is_palette or page.is_stk
+                    or page.is_lsm or page.is_nih or page.is_imagej
+                    or 'extra_samples' in page.tags
+                    or page.bits_per_sample not in (8, 16, 32, 64)):
+                raise ValueError("file layout not supported")
+            self.shape = page.shape
+            self.dtype = numpy.dtype(tif.byteorder + page.dtype)
+            self.nbytes = int(numpy.prod(self.shape)) * self.dtype.itemsize
+            self._byteorder = tif.byteorder
+            if tif.is_bigtiff:
+                self._formats = ('Q', 20, 'Q', 8)
+            else:
+                self._formats = ('H', 12, 'I', 4)
+            fh = tif._fh
+            fh.seek(0)
+            self._header = fh.read(4)
+            self._entries = self._read_entries(fh)
+            self.offset = self._data_offset(fh)
+            if self.offset is None:
+                raise ValueError("image data are not contiguous")
+
+    def _read_entries(self, fh):
+        """Return dict of raw IFD entries of layout and strip tags."""
+        numtag_format, tag_size, offset_format, offset_size = self._formats
+        unpack = struct.unpack
+        fh.seek(0)
+        header = fh.read(16)
+        if header[:4] != self._header:
+            return None
+        if offset_size == 4:
+            offset = unpack(self._byteorder+'I', header[4:8])[0]
+        else:
+            offset = unpack(self._byteorder+'Q', header[8:16])[0]
+        fh.seek(offset)
+        size = struct.calcsize(numtag_format)
+        numtags = unpack(self._byteorder+numtag_format, fh.read(size))[0]
+        data = fh.read(numtags * tag_size)
+        entries = {}
+        for i in range(0, len(data), tag_size):
+            code = unpack(self._byteorder+'H', data[i:i+2])[0]
+            if code in (273, 279) or code in self.LAYOUT_TAGS:
+                entries[code] = data[i+2:i+tag_size]
+        return entries
+
+    def _data_offset(self, fh):
+        """Return offset of image data in open file or None.
+
+        None is returned if the layout differs from the template or the
+        strips are not contiguous.
+
+        """
+        try:
+            entries = self._read_entries(fh)
+            if entries is None or any(
+                    entries.get(code) != self._entries.get(code)
+                    for code in self.LAYOUT_TAGS):
+                return None
+            offsets = self._tag_values(fh, entries[273])
+            byte_counts = self._tag_values(fh, entries[279])
+        except (KeyError, struct.error):
+            return None
+        if (len(offsets) != len(byte_counts) or
+                sum(byte_counts) < self.nbytes or
+                any(offsets[i] + byte_counts[i] != offsets[i+1]
+                    for i in range(len(offsets)-1))):
+            return None
+        return offsets[0]
+
+    def _tag_values(self, fh, entry):
+        """Return tuple of integer values from raw IFD entry."""
+        numtag_format, tag_size, offset_format, offset_size = self._formats
+        byteorder = self._byteorder
+        dtype = {3: 'H', 4: 'I', 16: 'Q'}[
+            struct.unpack(byteorder+'H', entry[:2])[0]]
+        count = struct.unpack(byteorder+offset_format,
+                              entry[2:2+offset_size])[0]
+        size = count * struct.calcsize(dtype)
+        value = entry[2+offset_size:]
+        if size > offset_size:
+            fh.seek(struct.unpack(byteorder+offset_format, value)[0])
+            value = fh.read(size)
+        return struct.unpack(byteorder+'%i%s' % (count, dtype), value[:size])
+
+    def read(self, filename, out=None):
+        """Return image data of file or None if its layout differs.
+
+        Parameters
+        ----------
+        filename : str
+            Name of file to read.
+        out : numpy array
+            C-contiguous array of self.shape to read the data into.
+            By default a new array of native byte order is returned.
+
+        """
+        with open(filename, 'rb') as fh:
+            offset = self._data_offset(fh)
+            if offset is None:
+                return None
+            if out is None:
+                out = numpy.empty(self.shape, self.dtype.newbyteorder('='))
+            if out.dtype == self.dtype and out.flags['C_CONTIGUOUS']:
+                data = out
+            else:
+                data = numpy.empty(self.shape, self.dtype)
+            fh.seek(offset)
+            if fh.readinto(data.data) != self.nbytes:
+                return None
+        if data is not out:
+            out[...] = data
+        return out
+
+    def memmap(self, filename):
+        """Return read-only memory map of image data or None."""
+        with open(filename, 'rb') as fh:
+            offset = self._data_offset(fh)
+        if offset is None:
+            return None
+        return numpy.memmap(filename, self.dtype, 'r', offset, self.shape)
+
+
 class TiffSequence(object):
     """Sequence of image files.
 
@@ -1693,6 +2497,7 @@ class TiffSequence(object):
         #if not os.path.isfile(files[0]):
         #    raise ValueError("file not found")
         self.files = files
+        self._fixed_layout = imread is TiffFile
 
         if hasattr(imread, 'asarray'):
             _imread = imread
@@ -1712,7 +2517,7 @@ class TiffSequence(object):
             self.axes = 'I'
             self.shape = (len(files),)
             self._start_index = (0,)
-            self._indices = ((i,) for i in range(len(files)))
+            self._indices = [(i,) for i in range(len(files))]
 
     def __str__(self):
         """Return string with information about image sequence."""
@@ -1737,19 +2542,61 @@ class TiffSequence(object):
     def asarray(self, *args, **kwargs):
         """Read image data from all files and return as single numpy array.
 
-        Raise IndexError if image shapes don't match.
+        Files are read concurrently by a pool of threads and each image is
+        written straight into the preallocated result array.
+        Additional arguments are passed to the imread function.
+        TIFF files with the fixed layout of the first file are read without
+        parsing their structure (see TiffLayout).
+
+        Raise ValueError if image shapes don't match.
+
+        Parameters
+        ----------
+        out : numpy array
+            Array of shape self.shape + image shape to write the result to.
+            By default a new array of the first image's data type is used.
+        maxworkers : int
+            Number of threads reading files concurrently.
+            By default one thread per CPU is used.
 
         """
-        im = self.imread(self.files[0])
+        out = kwargs.pop('out', None)
+        maxworkers = kwargs.pop('maxworkers', None)
+        indices = [tuple(i-j for i, j in zip(index, self._start_index))
+                   for index in self._indices]
+        complete = numpy.prod(self.shape) == len(self.files)
+
+        layout = None
+        if self._fixed_layout and not args and not kwargs:
+            try:
+                layout = TiffLayout(self.files[0])
+            except Exception:
+                pass
+        im = None if layout is None else layout.read(self.files[0])
+        if im is None:
+            im = self.imread(self.files[0], *args, **kwargs)
         result_shape = self.shape + im.shape
-        result = numpy.zeros(result_shape, dtype=im.dtype)
-        result = result.reshape(-1, *im.shape)
-        for index, fname in zip(self._indices, self.files):
-            index = [i-j for i, j in zip(index, self._start_index)]
-            index = numpy.ravel_multi_index(index, self.shape)
-            im = self.imread(fname, *args, **kwargs)
-            result[index] = im
-        result.shape = result_shape
+        if out is None:
+            if complete:
+                result = numpy.empty(result_shape, dtype=im.dtype)
+            else:
+                result = numpy.zeros(result_shape, dtype=im.dtype)
+        else:
+            if out.shape != result_shape:
+                raise ValueError("out array shape %s doesn't match %s" % (
+                                 str(out.shape), str(result_shape)))
+            result = out
+            if not complete:
+                result[...] = 0
+        result[indices[0]] = im
+        del im
+
+        def read(item):
+            index, fname = item
+            if layout is None or layout.read(fname, result[index]) is None:
+                result[index] = self.imread(fname, *args, **kwargs)
+
+        _thread_map(read, zip(indices[1:], self.files[1:]), maxworkers)
         return result
 
     def _parse(self):
@@ -1785,6 +2632,117 @@ class TiffSequence(object):
         self._start_index = start_index
 
 
+class TiffVolume(object):
+    """Lazy volume view of a sequence of equally shaped TIFF files.
+
+    Files are only opened when they are indexed. Image data of uncompressed
+    files is memory mapped such that only the byte ranges covered by an
+    index are actually read from disk. Other files are read completely.
+
+    Attributes
+    ----------
+    files : list
+        List of file names, one per slice.
+    shape : tuple
+        Number of files followed by the shape of the first page.
+    dtype : numpy.dtype
+        Data type of the first page.
+
+    Examples
+    --------
+    >>> vol = TiffVolume("slices/*.tif")
+    >>> vol.shape
+    (2048, 2048, 2048)
+    >>> sinos = vol[100:200, :, 512]
+    >>> sinos.shape
+    (100, 2048)
+
+    """
+    def __init__(self, files, maxworkers=None):
+        """Initialize instance from multiple files.
+
+        Parameters
+        ----------
+        files : str, or sequence of str
+            Glob pattern or sequence of file names.
+        maxworkers : int
+            Number of threads reading files concurrently.
+            By default one thread per CPU is used.
+
+        """
+        if isinstance(files, basestring):
+            files = natural_sorted(glob.glob(files))
+        files = list(files)
+        if not files:
+            raise ValueError("no files found")
+        self.files = files
+        self.maxworkers = maxworkers
+
+        with TiffFile(files[0], lazy=True) as tif:
+            page = tif.pages[0]
+            self.shape = (len(files), ) + page.shape
+            self.dtype = numpy.dtype(page.dtype)
+        try:
+            self._layout = TiffLayout(files[0])
+        except Exception:
+            self._layout = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def __str__(self):
+        """Return string with information about volume."""
+        return "\n".join([
+            self.files[0],
+            '* files: %i' % len(self.files),
+            '* shape: %s' % str(self.shape),
+            '* dtype: %s' % str(self.dtype)])
+
+    def __getitem__(self, key):
+        """Return numpy array of the volume region specified by key."""
+        if not isinstance(key, tuple):
+            key = (key, )
+        if Ellipsis in key:
+            i = key.index(Ellipsis)
+            fill = (slice(None), ) * (len(self.shape) - len(key) + 1)
+            key = key[:i] + fill + key[i+1:]
+        if len(key) > len(self.shape):
+            raise IndexError("too many indices")
+        first, rest = key[0], key[1:]
+
+        if isinstance(first, slice):
+            indices = list(range(*first.indices(len(self.files))))
+        elif isinstance(first, collections.Iterable):
+            indices = list(first)
+        else:
+            indices = [first]
+        for i, index in enumerate(indices):
+            if index < 0:
+                index += len(self.files)
+            if not 0 <= index < len(self.files):
+                raise IndexError("index %i out of range" % indices[i])
+            indices[i] = index
+
+        shape = numpy.empty(self.shape[1:], self.dtype)[rest].shape
+        result = numpy.empty((len(indices), ) + shape, self.dtype)
+
+        def read(item):
+            i, index = item
+            if self._layout is not None:
+                data = self._layout.memmap(self.files[index])
+                if data is not None:
+                    result[i] = data[rest]
+                    return
+            with TiffFile(self.files[index], lazy=True) as tif:
+                result[i] = tif.pages[0].asarray(memmap=True)[rest]
+
+        _thread_map(read, enumerate(indices), self.maxworkers)
+
+        if not isinstance(first, (slice, collections.Iterable)):
+            result = result[0]
+        return result
+
+
 class Record(dict):
     """Dictionary with attribute access.
 
@@ -2255,10 +3213,151 @@ def decodelzw(encoded):
     return b''.join(result)
 
 
+def decodepackbits_fast(encoded):
+    """Decompress PackBits encoded byte string.
+
+    Same as decodepackbits but literal and replicate runs are expanded
+    by bytearray slicing and repetition instead of per byte list items.
+
+    >>> decodepackbits_fast(b'\\x02abc\\xfdz\\x80\\x00d') == b'abczzzzd'
+    True
+
+    """
+    encoded = bytearray(encoded)
+    result = bytearray()
+    size = len(encoded)
+    i = 0
+    while i < size:
+        n = encoded[i]
+        i += 1
+        if n < 128:
+            result += encoded[i:i+n+1]
+            i += n + 1
+        elif n > 128:
+            result += encoded[i:i+1] * (257 - n)
+            i += 1
+    return bytes(result)
+
+
+def decodelzw_fast(encoded):
+    """Decompress LZW (Lempel-Ziv-Welch) encoded TIFF strip (byte string).
+
+    Same as decodelzw but codes are read from an integer bit buffer, which
+    is refilled byte by byte, and strings are appended to a bytearray.
+
+    """
+    encoded = bytearray(encoded)
+    len_encoded = len(encoded)
+    bitcount_max = len_encoded * 8
+
+    if len_encoded < 4:
+        raise ValueError("strip must be at least 4 characters long")
+
+    if (encoded[0] << 1) | (encoded[1] >> 7) != 256:
+        raise ValueError("strip must begin with CLEAR code")
+
+    if sys.version[0] == '2':
+        newtable = [chr(i) for i in range(256)]
+    else:
+        newtable = [bytes([i]) for i in range(256)]
+    newtable.extend((b'', b''))
+    switchbitch = {511: 10, 1023: 11, 2047: 12}  # table length: bit-width
+
+    result = bytearray()
+    buf = 0  # bits not consumed yet
+    bufbits = 0  # number of bits in buf
+    pos = 0  # next byte to shift into buf
+    bitcount = 0
+    bitw = 9
+    table = newtable
+    lentable = 258
+    code = 0
+    oldcode = 0
+    clear = True
+    while True:
+        while bufbits < bitw:
+            buf = (buf << 8) | (encoded[pos] if pos < len_encoded else 0)
+            pos += 1
+            bufbits += 8
+        bufbits -= bitw
+        code = buf >> bufbits
+        buf &= (1 << bufbits) - 1
+        bitcount += bitw
+        if code == 257:  # EOI
+            break
+        if bitcount >= bitcount_max and not clear:
+            break
+        if code == 256:  # CLEAR
+            table = newtable[:]
+            lentable = 258
+            bitw = 9
+            clear = True
+            continue
+        if clear:
+            if code > 255:
+                raise IndexError("invalid code %i after CLEAR" % code)
+            decoded = table[code]
+            clear = False
+        else:
+            if code < lentable:
+                decoded = table[code]
+                table.append(table[oldcode] + decoded[:1])
+            else:
+                decoded = table[oldcode]
+                decoded += decoded[:1]
+                table.append(decoded)
+            lentable += 1
+            if lentable in switchbitch:
+                bitw = switchbitch[lentable]
+        result += decoded
+        oldcode = code
+
+    if code != 257:
+        warnings.warn(
+            "decodelzw encountered unexpected end of stream (code %i)" % code)
+
+    return bytes(result)
+
+
+def set_decoder_backend(backend=None):
+    """Select implementation of the PackBits and LZW decoders.
+
+    The decoders are used by TiffPage.asarray via TIFF_DECOMPESSORS.
+
+    Parameters
+    ----------
+    backend : {None, 'c', 'fast', 'reference'}
+        'c': functions of the _tifffile extension module.
+        'fast': decodepackbits_fast and decodelzw_fast.
+        'reference': the original pure Python decodepackbits and decodelzw.
+        By default the extension module is used if it could be imported,
+        otherwise the fast Python functions.
+
+    """
+    have_c = '__old_decodelzw' in globals()
+    if backend is None:
+        backend = 'c' if have_c else 'fast'
+    if backend == 'c':
+        if not have_c:
+            raise ValueError("_tifffile extension module not available")
+        decoders = decodepackbits, decodelzw
+    elif backend == 'fast':
+        decoders = decodepackbits_fast, decodelzw_fast
+    elif backend == 'reference':
+        decoders = (globals().get('__old_decodepackbits', decodepackbits),
+                    globals().get('__old_decodelzw', decodelzw))
+    else:
+        raise ValueError("unknown decoder backend %s" % backend)
+    TIFF_DECOMPESSORS['packbits'], TIFF_DECOMPESSORS['lzw'] = decoders
+
+
 @_replace_by('_tifffile.unpackints')
 def unpackints(data, dtype, itemsize, runlen=0):
     """Decompress byte string to array of integers of any bit size <= 32.
 
+    Integers are decoded for all items at once by unpacking the data to
+    single bits and packing the bits of each item to the byte size of dtype.
+
     Parameters
     ----------
     data : byte str
@@ -2270,6 +3369,13 @@ def unpackints(data, dtype, itemsize, runlen=0):
     runlen : int
         Number of consecutive integers, after which to start at next byte.
 
+    Examples
+    --------
+    >>> unpackints(b'\\x01\\x23\\x45', 'H', 12, runlen=2)
+    array([ 18, 837], dtype=uint16)
+    >>> unpackints(b'\\xff\\xf0\\x0f\\xff', 'H', 12, runlen=1)
+    array([4095,  255], dtype=uint16)
+
     """
     if itemsize == 1:  # bitarray
         data = numpy.fromstring(data, '|B')
@@ -2290,6 +3396,37 @@ def unpackints(data, dtype, itemsize, runlen=0):
     itembytes = next(i for i in (1, 2, 4, 8) if 8 * i >= itemsize)
     if itembytes != dtype.itemsize:
         raise ValueError("dtype.itemsize too small")
+    if runlen == 0:
+        runlen = len(data) // itembytes
+        if runlen == 0:
+            return numpy.empty((0, ), dtype)
+    skipbits = runlen*itemsize % 8
+    if skipbits:
+        skipbits = 8 - skipbits
+    rowbits = runlen*itemsize + skipbits
+    rows = len(data)*8 // rowbits
+
+    # bits of all items as rows of itemsize bits, without row padding
+    bits = numpy.unpackbits(numpy.fromstring(data, '|B')[:rows*rowbits // 8])
+    bits = bits.reshape(rows, rowbits)[:, :runlen*itemsize]
+    # left pad items with zero bits to big endian integers of itembytes
+    result = numpy.zeros((rows*runlen, itembytes*8), '|B')
+    result[:, itembytes*8-itemsize:] = bits.reshape(-1, itemsize)
+    result = numpy.packbits(result, axis=-1).view('>u%i' % itembytes)
+    return result.reshape(-1).astype(dtype)
+
+
+def _unpackints_loop(data, dtype, itemsize, runlen=0):
+    """Return integers decoded from byte string one by one.
+
+    Previous implementation of unpackints, which is only kept for
+    benchmark_unpackints. Bits of items spanning more than itemsize
+    bytes, e.g. 14 bit integers starting at the 6th bit of a byte, are
+    lost. Sizes of 1, 8, 16, 32 and 64 bit are not supported.
+
+    """
+    dtype = numpy.dtype(dtype)
+    itembytes = next(i for i in (1, 2, 4, 8) if 8 * i >= itemsize)
     if runlen == 0:
         runlen = len(data) // itembytes
     skipbits = runlen*itemsize % 8
@@ -2319,6 +3456,105 @@ def unpackints(data, dtype, itemsize, runlen=0):
     return result
 
 
+def benchmark_unpackints(shape=(2048, 2048), itemsize=12, verbose=True):
+    """Compare run times of unpackints and the previous per item loop.
+
+    Random packed integers of itemsize bits are decoded, with each of the
+    shape[0] rows starting at a new byte. Return the two run times in
+    seconds.
+
+    Examples
+    --------
+    >>> times = benchmark_unpackints((64, 61), 12, verbose=False)
+
+    """
+    length, width = shape
+    rowbytes = (width * itemsize + 7) // 8
+    data = numpy.random.randint(0, 256, length * rowbytes).astype('u1')
+    data = data.tostring()
+    dtype = 'BBHHIIII'[(itemsize - 1) // 4]
+
+    times = []
+    for func in (unpackints, _unpackints_loop):
+        start = time.time()
+        result = func(data, dtype, itemsize, runlen=width)
+        times.append(time.time() - start)
+        if verbose:
+            print("%s: %.3f s" % (func.__name__, times[-1]))
+    if verbose:
+        equal = numpy.all(unpackints(data, dtype, itemsize, width) == result)
+        print("%i x %i %i bit integers, speedup %.1fx, results %s" % (
+            length, width, itemsize, times[1] / times[0],
+            'equal' if equal else 'differ'))
+    return times
+
+
+def benchmark_memory(filename=None, pages=20000, verbose=True):
+    """Compare memory used by all pages of a file opened in default mode
+    and in uniform mode, where pages are represented by TiffFrames.
+
+    If filename is None, a temporary file with the given number of small
+    uncompressed pages is written. Return the two sizes in bytes.
+
+    Examples
+    --------
+    >>> full, compact = benchmark_memory(pages=100, verbose=False)
+    >>> compact < full
+    True
+
+    """
+    import tempfile
+    tmpname = None
+    if filename is None:
+        fd, filename = tempfile.mkstemp('.tif')
+        os.close(fd)
+        tmpname = filename
+        data = numpy.zeros((16, 16), 'uint16')
+        with TiffWriter(filename) as tif:
+            for _ in range(pages):
+                tif.save(data)
+
+    sizes = []
+    try:
+        for uniform in (False, True):
+            start = time.time()
+            with TiffFile(filename, uniform=uniform) as tif:
+                for page in tif.pages:
+                    page.strip_offsets
+                elapsed = time.time() - start
+                sizes.append(_object_size(tif.pages,
+                                          exclude=(tif, tif._fh, tif._map)))
+                if verbose:
+                    print("%s: %s, %i bytes per page, %.3f s" % (
+                        'uniform' if uniform else 'default',
+                        format_size(sizes[-1]), sizes[-1] // len(tif.pages),
+                        elapsed))
+    finally:
+        if tmpname:
+            os.remove(tmpname)
+    if verbose:
+        print("uniform mode uses %.1f%% of the memory" % (
+            100.0 * sizes[1] / sizes[0]))
+    return sizes
+
+
+def _object_size(obj, exclude=()):
+    """Return approximate number of bytes used by obj and all objects it
+    refers to, except objects in exclude, classes, modules and functions."""
+    seen = set(id(x) for x in exclude)
+    stack = [obj]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType,
+                                               types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size
+
+
 def unpackrgb(data, dtype='<B', bitspersample=(5, 6, 5), rescale=True):
     """Return array from byte string containing packed samples.
 
@@ -2372,6 +3608,66 @@ def unpackrgb(data, dtype='<B', bitspersample=(5, 6, 5), rescale=True):
     return result.reshape(-1)
 
 
+def decodefloatpred(data, dtype, runlen, samples=1):
+    """Return array from byte string encoded with floating point predictor.
+
+    Each row of runlen values is stored as separate byte planes, most
+    significant byte first, and bytes are differenced with a distance
+    of samples (TIFF predictor 3).
+
+    Parameters
+    ----------
+    data : byte str
+        The data to be decoded. Trailing incomplete rows are ignored.
+    dtype : numpy.dtype
+        The floating point data type. The byte order is ignored.
+    runlen : int
+        Number of values in a row.
+    samples : int
+        Number of samples per pixel in contiguous planar configuration.
+
+    Returns
+    -------
+    result : ndarray
+        Flattened array of native dtype.
+
+    Examples
+    --------
+    >>> data = numpy.array([[0.5, 1.5, -2.0]], 'float32')
+    >>> print(decodefloatpred(encodefloatpred(data), 'f', 3))
+    [ 0.5  1.5 -2. ]
+
+    """
+    dtype = numpy.dtype(dtype)
+    itemsize = dtype.itemsize
+    rowbytes = runlen * itemsize
+    data = numpy.fromstring(data, 'u1')
+    data = data[:data.size // rowbytes * rowbytes]
+    data = data.reshape(-1, rowbytes // samples, samples)
+    data = numpy.cumsum(data, axis=1, dtype='u1')
+    data = data.reshape(-1, itemsize, runlen).transpose(0, 2, 1)
+    data = numpy.ascontiguousarray(data).view('>' + dtype.char)
+    return data.astype('=' + dtype.char).reshape(-1)
+
+
+def encodefloatpred(data, samples=1):
+    """Return byte string of floating point array encoded with predictor 3.
+
+    Inverse of decodefloatpred. The first dimension of data is the row
+    index, remaining dimensions are flattened to rows.
+
+    """
+    data = numpy.asarray(data)
+    itemsize = data.dtype.itemsize
+    rows = data.shape[0]
+    data = data.astype('>' + data.dtype.char).reshape(rows, -1)
+    data = data.view('u1').reshape(rows, -1, itemsize).transpose(0, 2, 1)
+    data = numpy.ascontiguousarray(data).reshape(rows, -1, samples)
+    result = data.copy()
+    result[:, 1:] = numpy.diff(data, axis=1)
+    return result.tostring()
+
+
 def reorient(image, orientation):
     """Return reoriented view of image array.
 
@@ -2403,6 +3699,62 @@ def reorient(image, orientation):
         return numpy.swapaxes(image, -3, -2)[..., ::-1, ::-1, :]
 
 
+def _thread_map(func, iterable, maxworkers=None):
+    """Return list of func applied to all items using a pool of threads.
+
+    Results are returned in order of the items. The first exception raised
+    by func is propagated to the caller and the remaining items are dropped.
+
+    Parameters
+    ----------
+    func : callable
+        Function of one argument. Should release the GIL for most of its
+        runtime, e.g. by doing file I/O or zlib (de)compression.
+    iterable : sequence
+        Arguments to func.
+    maxworkers : int
+        Maximum number of threads. By default one thread per CPU is used.
+
+    """
+    items = list(iterable)
+    if maxworkers is None:
+        maxworkers = multiprocessing.cpu_count()
+    maxworkers = min(maxworkers, len(items))
+    if maxworkers < 2:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(maxworkers)
+    try:
+        return list(pool.imap(func, items))
+    finally:
+        pool.terminate()
+
+
+def _read_segments(fh, offsets, byte_counts, maxgap=65536):
+    """Return list of byte strings read from file at offsets.
+
+    Segments that are adjacent in the file or separated by at most maxgap
+    bytes are fetched with a single seek and read.
+
+    """
+    result = [None] * len(offsets)
+    order = sorted(range(len(offsets)), key=lambda i: offsets[i])
+    i = 0
+    while i < len(order):
+        j = i + 1
+        start = offsets[order[i]]
+        end = start + byte_counts[order[i]]
+        while j < len(order) and offsets[order[j]] <= end + maxgap:
+            end = max(end, offsets[order[j]] + byte_counts[order[j]])
+            j += 1
+        fh.seek(start)
+        data = fh.read(end - start)
+        for k in order[i:j]:
+            result[k] = data[offsets[k]-start:offsets[k]-start+byte_counts[k]]
+        i = j
+    return result
+
+
 def numpy_fromfile(arg, dtype=float, count=-1, sep=''):
     """Return array from data in binary file.
 
@@ -2460,6 +3812,90 @@ def datetime_from_timestamp(n, epoch=datetime.datetime.fromordinal(693594)):
     return epoch + datetime.timedelta(n)
 
 
+def test_decoders(count=100, verbose=True):
+    """Compare decoded output of all available decoder backends.
+
+    Random PackBits streams and random valid LZW code sequences are decoded
+    by the reference, fast and, if available, C implementations.
+    Return number of streams with differing results.
+
+    Examples
+    --------
+    >>> test_decoders(20, verbose=False)
+    0
+
+    """
+    import random
+
+    def encode_codes(codes):
+        # pack LZW codes to bytes using the bit-widths of decodelzw
+        bits = []
+        lentable = 258
+        clear = True
+        for code in codes:
+            bitw = 9 if lentable < 511 else 10 if lentable < 1023 else (
+                11 if lentable < 2047 else 12)
+            bits.append(format(code, '0%ib' % bitw))
+            if code == 256:
+                lentable = 258
+                clear = True
+            elif clear:
+                clear = False
+            else:
+                lentable += 1
+        bits = ''.join(bits)
+        bits += '0' * (-len(bits) % 8)
+        return struct.pack('%iB' % (len(bits) // 8), *(
+            int(bits[i:i+8], 2) for i in range(0, len(bits), 8)))
+
+    def random_lzw():
+        codes = [256]
+        lentable = 258
+        clear = True
+        for _ in range(random.randint(1, 3000)):
+            if not clear and (lentable > 4000 or random.random() < 0.002):
+                codes.append(256)
+                lentable = 258
+                clear = True
+            elif clear:
+                codes.append(random.randint(0, 255))
+                clear = False
+            else:
+                codes.append(random.choice(
+                    (random.randint(0, 255), random.randint(258, lentable))))
+                lentable += 1
+        codes.append(257)
+        return encode_codes(codes)
+
+    def random_packbits():
+        size = random.randint(0, 2000)
+        return struct.pack('%iB' % size, *(
+            random.choice((random.randint(0, 255), random.randint(120, 136)))
+            for _ in range(size)))
+
+    backends = {
+        'reference': (globals().get('__old_decodepackbits', decodepackbits),
+                      globals().get('__old_decodelzw', decodelzw)),
+        'fast': (decodepackbits_fast, decodelzw_fast)}
+    if '__old_decodelzw' in globals():
+        backends['c'] = (decodepackbits, decodelzw)
+
+    failed = 0
+    for _ in range(count):
+        for i, encoded in enumerate((random_packbits(), random_lzw())):
+            results = dict((name, funcs[i](encoded))
+                           for name, funcs in backends.items())
+            if any(r != results['reference'] for r in results.values()):
+                failed += 1
+                if verbose:
+                    print("%s mismatch for %s" % (
+                        ('packbits', 'lzw')[i], repr(encoded[:16])))
+    if verbose:
+        print("%i of %i streams decoded identically by %s" % (
+            2*count - failed, 2*count, ', '.join(sorted(backends))))
+    return failed
+
+
 def test_tifffile(directory='testimages', verbose=True):
     """Read all images in directory. Print error message on failure.
 
@@ -2570,6 +4006,8 @@ TIFF_DECOMPESSORS = {
     'lzw': decodelzw,
 }
 
+set_decoder_backend()
+
 TIFF_DATA_TYPES = {
     1: '1B',   # BYTE 8-bit unsigned integer.
     2: '1s',   # ASCII 8-bit byte that contains a 7-bit ASCII code;
@@ -3178,7 +4616,7 @@ TIFF_TAGS = {
     306: ('datetime', None, 2, None, None),
     315: ('artist', None, 2, None, None),
     316: ('host_computer', None, 2, None, None),
-    317: ('predictor', 1, 3, 1, {1: None, 2: 'horizontal'}),
+    317: ('predictor', 1, 3, 1, {1: None, 2: 'horizontal', 3: 'float'}),
     320: ('color_map', None, 3, None, None),
     322: ('tile_width', None, 4, 1, None),
     323: ('tile_length', None, 4, 1, None),
@@ -3249,6 +4687,9 @@ CUSTOM_TAGS = {
 # Max line length of printed output
 PRINT_LINE_LEN = 79
 
+# TiffTag instances with default values, created on first use
+_DEFAULT_TAGS = {}
+
 
 def imshow(data, title=None, vmin=0, vmax=None, cmap=None,
            bitspersample=None, photometric='rgb', interpolation='nearest',
@@ -1,13 +1,21 @@
 """Various utility functions."""
 import argparse
+import fnmatch
 import glob
 import logging
 import math
 import os
+import re
+from tofu import formats
+from tofu.index import image_info, is_indexed, list_files, natural_key
 
 
 LOG = logging.getLogger(__name__)
 
+# get_filenames results keyed by path, stored with the directory modification time they are
+# valid for
+_FILENAMES = {}
+
 
 def range_from(s):
     """
@@ -53,6 +61,44 @@ def set_node_props(node, args):
                 node.set_property(name, getattr(args, name))
 
 
+def setup_read_task(task, path, raw_shape=None, raw_dtype='float32', raw_offset=0):
+    """Set up UFO read *task* to read from *path*. For raw files the image layout given by
+    *raw_shape* (width, height), *raw_dtype* and *raw_offset* is passed to the task.
+    """
+    task.props.path = path
+
+    if formats.is_raw(path):
+        import numpy as np
+        if not raw_shape:
+            raise ValueError("--raw-shape must be specified for raw file '{}'".format(path))
+        if not hasattr(task.props, 'raw_width'):
+            raise RuntimeError("UFO read task does not support raw files")
+
+        width, height = raw_shape
+        task.props.raw_width = width
+        task.props.raw_height = height
+        task.props.raw_bitdepth = np.dtype(raw_dtype).itemsize * 8
+        for name in ('raw_pre_offset', 'raw_offset'):
+            if hasattr(task.props, name):
+                task.set_property(name, raw_offset)
+                break
+
+
+def setup_binning(pm, graph, task, factor):
+    """Bin the output of UFO *task* by *factor* in both dimensions with a bin task from plugin
+    manager *pm* connected in *graph*. Return the task whose output is binned, which is *task*
+    itself if *factor* is 1.
+    """
+    if factor <= 1:
+        return task
+
+    binning = pm.get_task('bin')
+    binning.props.size = factor
+    graph.connect_nodes(task, binning)
+
+    return binning
+
+
 def positive_int(value):
     """Convert *value* to an integer and make sure it is positive."""
     result = int(value)
@@ -62,6 +108,24 @@ def positive_int(value):
     return result
 
 
+def strictly_positive_int(value):
+    """Convert *value* to an integer and make sure it is greater than zero."""
+    result = int(value)
+    if result <= 0:
+        raise argparse.ArgumentTypeError('Only integers greater than zero are allowed')
+
+    return result
+
+
+def positive_float(value):
+    """Convert *value* to a float and make sure it is greater than zero."""
+    result = float(value)
+    if result <= 0:
+        raise argparse.ArgumentTypeError('Only values greater than zero are allowed')
+
+    return result
+
+
 def tupleize(num_items, conv=None):
     """Convert comma-separated string values to a *num-items*-tuple of values converted with
     *conv*.
@@ -81,14 +145,42 @@ def tupleize(num_items, conv=None):
     return split_values
 
 
-def get_filenames(path):
+def get_filenames(path, **raw_options):
     """Get all filenams from *path*, which could be a directory or a pattern
-    for matching files in a directory.
+    for matching files in a directory. File names are sorted naturally, i.e. 'f2' comes before
+    'f10'. The directory listing is taken from the dataset index and results are cached for the
+    lifetime of the process as long as the directory does not change. For a raw file or an HDF5
+    dataset references to its images are returned, see :mod:`tofu.formats`. Raw files are read
+    with the layout given by *raw_options*, see :func:`tofu.formats.open_stack`.
     """
+    if formats.is_stack(path):
+        return ['{}#{}'.format(path, i)
+                for i in range(len(formats.open_stack(path, **raw_options)))]
+
+    directory = path if os.path.isdir(path) else os.path.dirname(path) or '.'
+    try:
+        mtime = os.stat(directory).st_mtime
+    except OSError:
+        mtime = None
+
+    cached = _FILENAMES.get(path)
+    if mtime is None or cached is None or cached[0] != mtime:
+        cached = (mtime, _find_filenames(path))
+        _FILENAMES[path] = cached
+
+    return list(cached[1])
+
+
+def _find_filenames(path):
     if os.path.isdir(path):
-        path = os.path.join(path, '*')
+        return [os.path.join(path, name) for name in list_files(path)]
 
-    return sorted(glob.glob(path))
+    directory, pattern = os.path.split(path)
+    if glob.has_magic(directory) or pattern.startswith('.') or not os.path.isdir(directory or '.'):
+        return sorted(glob.glob(path), key=natural_key)
+
+    return [os.path.join(directory, name)
+            for name in fnmatch.filter(list_files(directory or '.'), pattern)]
 
 
 def next_power_of_two(number):
@@ -96,24 +188,243 @@ def next_power_of_two(number):
     return 2 ** int(math.ceil(math.log(number, 2)))
 
 
-def read_image(filename):
-    """Read image from file *filename*."""
-    if filename.lower().endswith('.tif'):
+def get_padding(width):
+    """Return a tuple (padded_width, x) for sinograms of *width* pixels, where *x* is the number
+    of pixels added on the left.
+    """
+    padding = next_power_of_two(width + 32) - width
+
+    return (width + padding, padding // 2)
+
+
+def get_output_name(output_path):
+    """Return the file name pattern of the slices written to *output_path*, which is either a
+    directory, a pattern containing e.g. %05i or a raw file or an HDF5 dataset.
+    """
+    if formats.is_stack(output_path):
+        # Raw files and HDF5 datasets are written by the UFO write task as they are
+        return output_path
+
+    abs_path = os.path.abspath(output_path)
+
+    if re.search(r"%[0-9]*i", output_path):
+        return abs_path
+
+    return os.path.join(abs_path, 'slice-%05i.tif')
+
+
+def bin_image(image, factor, dtype=None):
+    """Return the mean of *factor* x *factor* blocks of the last two dimensions of *image* as
+    *dtype*, which defaults to np.float32 for integer images. Incomplete blocks at the right and
+    bottom are dropped.
+    """
+    import numpy as np
+
+    if dtype is None:
+        dtype = image.dtype if image.dtype.kind == 'f' else np.float32
+    height = image.shape[-2] // factor
+    width = image.shape[-1] // factor
+    blocks = image[..., :height * factor, :width * factor]
+    blocks = blocks.reshape(image.shape[:-2] + (height, factor, width, factor))
+
+    return blocks.mean(axis=(-3, -1), dtype=dtype)
+
+
+def read_image(filename, y=0, height=None, y_step=1, dtype=None, binning=1, **raw_options):
+    """Read image from file *filename*. Only rows starting at *y* with *height* rows (all rows
+    until the end if None) and every *y_step*-th row are returned. For TIFF files only the data
+    covering these rows is read, uncompressed EDF files are memory mapped. *filename* can also be
+    a reference to an image of a raw file or an HDF5 dataset, see :mod:`tofu.formats`. If *dtype*
+    is given, the selected rows are converted to it while reading, e.g. np.float32 for
+    computations, without intermediate copies in the original data type. If *binning* is greater
+    than 1, the selected rows are read in bands which are binned by *binning* in both dimensions
+    right away, see :func:`bin_image`, so that full resolution data is never held in memory.
+    Raw files are read with the layout given by *raw_options*, see
+    :func:`tofu.formats.open_stack`.
+    """
+    import numpy as np
+
+    if binning > 1:
+        return _read_binned(filename, y, height, y_step, dtype, binning, raw_options)
+
+    y_end = None if height is None else y + height
+    stack, index = formats.split_reference(filename)
+
+    if index is not None or formats.is_stack(filename):
+        image = formats.open_stack(stack, **raw_options).read(index or 0, y=y, height=height,
+                                                              y_step=y_step)
+    elif filename.lower().endswith('.tif'):
         from tofu.tifffile import TiffFile
-        import numpy as np
-        with TiffFile(filename) as tif:
-            image = np.copy(tif.asarray())
+        if is_indexed(filename):
+            width, image_height, file_dtype, num_pages, offset = image_info(filename)
+            if offset is not None and num_pages == 1:
+                # Uncompressed contiguous data at an offset known from the dataset index
+                image = np.memmap(filename, dtype=file_dtype, mode='r', offset=offset,
+                                  shape=(image_height, width))
+                return image[y:y_end:y_step].astype(dtype or
+                                                    np.dtype(file_dtype).newbyteorder('='))
+
+        with TiffFile(filename, use_mmap=True) as tif:
+            if len(tif.pages) == 1:
+                return tif.pages[0].asarray(y=y, height=height, y_step=y_step, dtype=dtype)
+            return np.array(tif.asarray(memmap=True)[..., y:y_end:y_step, :], dtype=dtype)
     elif '.edf' in filename.lower():
-        import fabio
-        edf = fabio.edfimage.edfimage()
-        edf.read(filename)
-        image = edf.data
+        image = read_edf(filename)
+        if image is None:
+            import fabio
+            edf = fabio.edfimage.edfimage()
+            edf.read(filename)
+            image = edf.data
+        image = image[y:y_end:y_step]
     else:
         raise ValueError('Unsupported image format')
 
+    if dtype is not None:
+        image = np.asarray(image, dtype=dtype)
+
     return image
 
 
+def _read_binned(filename, y, height, y_step, dtype, binning, raw_options):
+    import numpy as np
+
+    width, image_height = probe_image(filename, **raw_options)[:2]
+    rows = range(y, image_height if height is None else min(y + height, image_height), y_step)
+    num_bins = len(rows) // binning
+    # Bin bands of about 4 MB of input rows at once
+    bins_per_band = max(1, 2 ** 22 // (width * 4 * binning))
+    bands = []
+
+    for first in range(0, num_bins, bins_per_band):
+        last = min(first + bins_per_band, num_bins)
+        band = read_image(filename, y=rows[first * binning],
+                          height=(last - first) * binning * y_step - y_step + 1, y_step=y_step,
+                          **raw_options)
+        bands.append(bin_image(band, binning, dtype=dtype))
+
+    if not bands:
+        raise ValueError("Less than {} rows selected for binning".format(binning))
+
+    return np.concatenate(bands, axis=-2)
+
+
+EDF_DATA_TYPES = {
+    'SignedByte': 'i1', 'UnsignedByte': 'u1', 'UnsignedChar': 'u1',
+    'SignedShort': 'i2', 'SignedShortInteger': 'i2',
+    'UnsignedShort': 'u2', 'UnsignedShortInteger': 'u2',
+    'SignedInteger': 'i4', 'SignedLong': 'i4', 'SignedLongInteger': 'i4',
+    'UnsignedInteger': 'u4', 'UnsignedLong': 'u4', 'UnsignedLongInteger': 'u4',
+    'Signed64': 'i8', 'Unsigned64': 'u8',
+    'FloatValue': 'f4', 'Float': 'f4', 'FloatIEEE32': 'f4', 'Real': 'f4',
+    'DoubleValue': 'f8', 'Double': 'f8', 'DoubleIEEE64': 'f8'
+}
+
+
+def read_edf_header(filename):
+    """Read the first header of EDF file *filename*. Return a tuple (header, size), where
+    *header* is a dictionary of the header's key-value pairs and *size* the header length in
+    bytes (the image data start right after it).
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(512)
+        if not header.startswith(b'{'):
+            raise ValueError("'{}' is not an EDF file".format(filename))
+        while b'}' not in header:
+            block = f.read(512)
+            if not block:
+                raise ValueError("Unterminated EDF header in '{}'".format(filename))
+            header += block
+        if header.endswith(b'}'):
+            header += f.read(1)
+
+    # Image data start after the closing brace and its newline
+    size = header.index(b'}') + 1
+    if header[size:size + 1] == b'\n':
+        size += 1
+
+    result = {}
+    for item in header[1:header.index(b'}')].decode('ascii', 'replace').split(';'):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            result[key.strip()] = value.strip()
+
+    return result, size
+
+
+def get_edf_properties(header):
+    """Return a tuple (width, height, dtype, size) of the image described by the EDF *header*
+    dictionary, where *size* is the number of data bytes.
+    """
+    import numpy as np
+
+    dtype = np.dtype(EDF_DATA_TYPES[header['DataType']])
+    if header.get('ByteOrder') == 'HighByteFirst':
+        dtype = dtype.newbyteorder('>')
+    elif header.get('ByteOrder') == 'LowByteFirst':
+        dtype = dtype.newbyteorder('<')
+    width = int(header['Dim_1'])
+    height = int(header.get('Dim_2', 1))
+    size = int(header.get('Size', width * height * dtype.itemsize))
+
+    return (width, height, dtype, size)
+
+
+def read_edf(filename, out=None):
+    """Read the first image of EDF file *filename* without fabio. Return a read-only numpy.memmap
+    of the image or, if *out* is given, read the data into *out* and return it. Compressed files
+    are not supported, in which case None is returned.
+    """
+    import numpy as np
+
+    header, offset = read_edf_header(filename)
+    if header.get('Compression', 'None') != 'None':
+        return None
+
+    width, height, dtype, size = get_edf_properties(header)
+
+    if out is None:
+        return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(height, width))
+
+    if out.shape != (height, width):
+        raise ValueError("Output shape {} does not match image shape {}".format(out.shape,
+                                                                                 (height, width)))
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        if out.dtype == dtype and out.flags['C_CONTIGUOUS']:
+            if f.readinto(out.data) != out.nbytes:
+                raise ValueError("'{}' is truncated".format(filename))
+        else:
+            out[...] = np.fromfile(f, dtype=dtype, count=width * height).reshape(height, width)
+
+    return out
+
+
+def probe_image(filename, **raw_options):
+    """Determine the properties of image *filename* from its metadata without reading the pixel
+    data. Return a tuple (width, height, dtype, num_pages). Raw files are described by
+    *raw_options*, see :func:`tofu.formats.open_stack`.
+    """
+    import numpy as np
+
+    stack, index = formats.split_reference(filename)
+    if index is not None or formats.is_stack(filename):
+        stack = formats.open_stack(stack, **raw_options)
+        num_pages, height, width = stack.shape
+        return (width, height, np.dtype(stack.dtype), 1 if index is not None else num_pages)
+    elif filename.lower().endswith('.tif'):
+        from tofu.tifffile import TiffFile
+        with TiffFile(filename, lazy=True, use_mmap=True) as tif:
+            page = tif.pages[0]
+            return (page.image_width, page.image_length, np.dtype(page.dtype), len(tif.pages))
+    elif '.edf' in filename.lower():
+        header, header_size = read_edf_header(filename)
+        width, height, dtype, data_size = get_edf_properties(header)
+        num_pages = max(1, os.path.getsize(filename) // (header_size + data_size))
+        return (width, height, dtype, num_pages)
+
+    raise ValueError('Unsupported image format')
+
+
 def determine_shape(args):
     """Determine input shape from *args* which means either width and height are specified in
     args or try to read the input and determine the shape from it. Return a tuple (width, height).
@@ -122,14 +433,18 @@ def determine_shape(args):
     height = args.height
 
     if not (width and height):
-        filename = get_filenames(args.input)[0]
+        raw_options = formats.get_raw_options(args)
+        filename = get_filenames(args.input, **raw_options)[0]
         try:
-            image = read_image(filename)
+            if formats.split_reference(filename)[1] is not None or not is_indexed(filename):
+                image_width, image_height = probe_image(filename, **raw_options)[:2]
+            else:
+                image_width, image_height = image_info(filename)[:2]
             # Now set the width and height but only if they were not specified
             if not width:
-                width = image.shape[1]
+                width = image_width
             if not height:
-                height = image.shape[0]
+                height = image_height
         except:
             LOG.info("Couldn't determine image dimensions from '{}'".format(filename))
 
@@ -145,16 +145,8 @@ class VolumeViewer(QtGui.QWidget):
 
     def load_files(self, filenames):
         """Load *filenames* for display."""
-        filenames = filenames[::self.step]
-        num = len(filenames)
-        first = read_tiff(filenames[0])[::self.step, ::self.step]
-        width, height = first.shape
-        data = np.empty((width, height, num), dtype=np.float32)
-        data[:,:,0] = first
-
-        for i, filename in enumerate(filenames[1:]):
-            data[:, :, i + 1] = read_tiff(filename)[::self.step, ::self.step]
-
+        volume = tifffile.TiffVolume(filenames)
+        data = volume[::self.step, ::self.step, ::self.step].T.astype(np.float32)
         volume = create_volume(data)
         dx, dy, dz, _ = volume.shape
 